@@ -1,4 +1,5 @@
 from database import MongoDBAsync
+from helper import helper
 
 from pymongo.errors import BulkWriteError
 from pymongo.operations import UpdateOne
@@ -8,20 +9,10 @@ from beem.account import Account
 from beem.exceptions import AccountDoesNotExistsException
 
 import asyncio
-import secrets
 
 async def generate_account_ids(amount : int = 1) -> list:
-    '''Generate some unused ids'''
-    choosed = set([])
-    while len(choosed) < amount:
-        some_ids = [secrets.randbelow(2000000000) for _ in range(10 * amount * 2)]
-        async for used_ids in MongoDBAsync.account_info.find({"_id" : {"$in" : some_ids}}, {"_id" : 1}):
-            some_ids.remove(used_ids["_id"])
-        
-        for _id in some_ids:
-            choosed.add(_id)
-
-    return list(choosed)[0:amount]
+    '''Generate some unused ids (reserved blocks of database.IdAllocator, no probing)'''
+    return await MongoDBAsync.account_ids.allocate_async(amount)
 
 
 #   *** Find Accounts ***
@@ -29,14 +20,14 @@ async def username_to_id(usernames : list) -> list:
     '''Get _ids of usernames. -1 if it does not exist'''
     # Prepare
     account_ids = [-1 for _ in usernames]
+    positions = helper.index_positions(usernames)
 
-    cursor = MongoDBAsync.account_info.find({"name" : {"$in" : usernames}})
+    cursor = MongoDBAsync.account_info.find({"name" : {"$in" : list(positions.keys())}}, {"name" : 1})
 
     # Find and Set _ids
     async for account in cursor:
-        for index, username in enumerate(usernames):
-            if username == account["name"]:
-                account_ids[index] = account["_id"]
+        for index in positions.get(account["name"], []):
+            account_ids[index] = account["_id"]
 
     return account_ids
 
@@ -49,14 +40,14 @@ async def get_account_data(accounts : list) -> list:
         # Convert Usernames to _id
         accounts = await username_to_id(accounts)
 
-    cursor = MongoDBAsync.account_data.find({"_id" : {"$in" : accounts}})
+    positions = helper.index_positions(accounts)
+    cursor = MongoDBAsync.account_data.find({"_id" : {"$in" : list(positions.keys())}})
 
     # Set correct data in list
     account_data = [None for _ in accounts]
     async for db_acc in cursor:
-        for index, in_acc in enumerate(accounts):
-            if in_acc == db_acc["_id"]:
-                account_data[index] = db_acc
+        for index in positions.get(db_acc["_id"], []):
+            account_data[index] = db_acc
 
     return account_data
 
@@ -65,21 +56,21 @@ async def get_account_info(accounts : list) -> list:
     if len(accounts) == 0:
         return []
     
-    cursor = None 
+    key = None
+    positions = helper.index_positions(accounts)
     if isinstance(accounts[0], str):
         # Usernames
-        cursor = MongoDBAsync.account_info.find({"name" : {"$in" : accounts}})
+        key = "name"
     if isinstance(accounts[0], int):
         # _id
-        cursor = MongoDBAsync.account_info.find({"_id" : {"$in" : accounts}})
+        key = "_id"
 
     account_info = [None for _ in accounts]
-    if cursor:
+    if key:
         # Set correct data in list
-        async for db_acc in cursor:
-            for index, in_acc in enumerate(accounts):
-                if in_acc == db_acc["name"] or in_acc == db_acc["_id"]:
-                    account_info[index] = db_acc
+        async for db_acc in MongoDBAsync.account_info.find({key : {"$in" : list(positions.keys())}}):
+            for index in positions.get(db_acc[key], []):
+                account_info[index] = db_acc
 
     return account_info
    
@@ -110,10 +101,10 @@ async def update_account_profile(accounts : list, profiles : list) -> None:
 
 async def remove_banned(usernames : list, post_ids : list) -> list:
     '''Remove all banned accs'''
-    async for banned in MongoDBAsync.banned.find({"name" : {"$in" : usernames}}):
-        for index, _ in enumerate(usernames):
-            if usernames[index] == banned["name"]:
-                post_ids[index] = 0
+    positions = helper.index_positions(usernames)
+    async for banned in MongoDBAsync.banned.find({"name" : {"$in" : list(positions.keys())}}):
+        for index in positions.get(banned["name"], []):
+            post_ids[index] = 0
     return post_ids
 
 async def append_accounts(usernames : list, save_call = True) -> list:
@@ -121,7 +112,6 @@ async def append_accounts(usernames : list, save_call = True) -> list:
     # Get all _ids of already entered, else they are -1
     account_ids = await username_to_id(usernames)
     account_ids = await remove_banned(usernames, account_ids)
-    open_ids = await generate_account_ids(len(usernames))
 
     # Check whether they exist
     if not save_call:
@@ -131,15 +121,14 @@ async def append_accounts(usernames : list, save_call = True) -> list:
             except AccountDoesNotExistsException:
                 account_ids[index] = -1
 
-    # Enter all -1 indexes
+    # Enter all -1 indexes (already inside, banned or else are > -1)
+    new_indexes = [index for index, _id in enumerate(account_ids) if _id == -1]
+    open_ids = await generate_account_ids(len(new_indexes))
+
     new_accounts = []
-    for index, name in enumerate(usernames):
-        if account_ids[index] > -1:
-            # Already inside, banned or else
-            continue
-        
-        account_ids[index] = open_ids[index]
-        new_accounts.append({"_id" : open_ids[index], "name" : name})
+    for index, _id in zip(new_indexes, open_ids):
+        account_ids[index] = _id
+        new_accounts.append({"_id" : _id, "name" : usernames[index]})
 
     if len(new_accounts) > 0:
         try:
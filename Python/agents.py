@@ -1,7 +1,7 @@
 from config import *
 
-from pymongo import MongoClient
-from database import MongoDBAsync, MongoDB
+from pymongo import MongoClient, UpdateOne
+from database import MongoDBAsync, MongoDB, get_mongo_client
 
 import numpy as np
 import nmslib
@@ -9,78 +9,327 @@ from hashlib import sha256
 
 from datetime import datetime, timedelta
 import asyncio
-import time
+import time, os
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PostsSegment():
+    '''
+    HNSW index (nmslib) over the categorized posts of one day. 
+    The index stores the row of a post, ids / vectors / timestamps hold the posts in that order.
+    '''
+    def __init__(self, day : np.datetime64, ids : np.ndarray, vectors : np.ndarray, timestamps : np.ndarray) -> None:
+        self.day = day # np.datetime64[D]
+        self.ids, self.vectors, self.timestamps = ids, vectors, timestamps
+        self.search_index = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def build(self):
+        '''Builds the index of all vectors (one batch)'''
+        search_index = nmslib.init(method='hnsw', space='cosinesimil')
+        search_index.addDataPointBatch(self.vectors, ids=np.arange(len(self.ids), dtype=np.int32))
+        search_index.createIndex({'post': 2}, print_progress=False)
+        self.search_index = search_index
+        return self
+
+    def search(self, queries : np.ndarray, k : int, num_threads : int = 1) -> tuple:
+        '''
+        Returns (rows : np.array[int64] [queries, k], distances : np.array[float32] [queries, k]). 
+        Rows with less than k results are filled with row -1 and distance inf
+        '''
+        rows = np.full((len(queries), k), -1, dtype=np.int64)
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for i, (row_ids, row_distances) in enumerate(self.search_index.knnQueryBatch(queries, k=k, num_threads=num_threads)):
+            rows[i, :len(row_ids)], distances[i, :len(row_ids)] = row_ids, row_distances
+        return (rows, distances)
+
+    def save(self, directory : str) -> None:
+        '''Saves index and arrays as <day>.hnsw(.dat) and <day>.npz (temporary files first)'''
+        path = lambda name: os.path.join(directory, f"{self.day}.{name}")
+        self.search_index.saveIndex(path("tmp.hnsw"), save_data=True)
+        np.savez(path("tmp.npz"), ids=self.ids, vectors=self.vectors, timestamps=self.timestamps)
+
+        os.replace(path("tmp.hnsw"), path("hnsw"))
+        os.replace(path("tmp.hnsw.dat"), path("hnsw.dat"))
+        os.replace(path("tmp.npz"), path("npz"))
+
+    @staticmethod
+    def files(directory : str, day : np.datetime64) -> list:
+        return [os.path.join(directory, f"{day}.{name}") for name in ("hnsw", "hnsw.dat", "npz")]
+
+    @staticmethod
+    def load(directory : str, day : np.datetime64):
+        '''Loads a saved segment. Returns None when there is none'''
+        index_path, _, arrays_path = PostsSegment.files(directory, day)
+        if not all(os.path.isfile(name) for name in PostsSegment.files(directory, day)):
+            return None
+
+        with np.load(arrays_path) as arrays:
+            segment = PostsSegment(day, arrays["ids"], arrays["vectors"], arrays["timestamps"])
+        segment.search_index = nmslib.init(method='hnsw', space='cosinesimil')
+        segment.search_index.loadIndex(index_path, load_data=True)
+        return segment
 
 
 class PostsCategory():
+    '''
+    Search index over the categories of all posts of the last POSTS_SEARCH_INDEX_DAYS days, sharded into one PostsSegment per day.
+    A refresh only loads posts which were categorized since the last build and builds the segments of their days again 
+    (mostly today). Expired days are dropped as a whole, so posts expire with their day.
+    Queries fan out over all segments and the top-k are merged, optionally with a recency decay.
+    The segments are saved into POSTS_SEARCH_INDEX_PATH and loaded at startup.
+    The "Posts Search Index" process (main.py -psi, PostsCategory.start) builds, refreshes and saves them. 
+    Processes which search run run_search_index as a task themselves, or load the saved segments (load_search_index).
+    '''
+    segments = {} # {day : PostsSegment}
+    search_records = 0
+    build_timestamp : datetime = None # posts categorized before are in the index (compared with categories_timestamp of the DB)
+    executor = ThreadPoolExecutor(max_workers=POSTS_SEARCH_THREADS) # fan-out of the queries
+
     @staticmethod
-    async def create_search_index(waiting_intervall : int = 1000):
-        '''Loads&Creates search index'''   
-        # Create Index and load data from DB
-        # Only Posts from the last 10 days  
-        date = datetime.utcnow() - timedelta(days=10)
+    async def load_posts(query : dict, waiting_intervall : int = 1000) -> tuple:
+        '''
+        Loads all posts matching query. Returns (ids, vectors, timestamps) of the categorized posts 
+        and the ids of all found posts (also the uncategorized ones). Every post is returned once
+        '''
+        found_ids, ids, vectors, timestamps = [], [], [], []
+        seen_ids = set() # a cursor can return a post twice when it is updated during the scan
+        async for post in MongoDBAsync.post_data.find(query, projection={"categories" : 1, "timestamp" : 1}):
+            if post["_id"] in seen_ids:
+                continue
+            seen_ids.add(post["_id"])
 
-        records, data = 0, None
-        search_index = nmslib.init(method='hnsw', space='cosinesimil')
-        async for post in MongoDBAsync.post_data.find({"timestamp" : {"$gte" : date}}):
-            if not post["categories"]:
+            found_ids.append(post["_id"])
+            if post.get("categories", None):
+                ids.append(post["_id"])
+                vectors.append(post["categories"])
+                timestamps.append(post["timestamp"])
+
+            if (len(found_ids) % waiting_intervall) == 0:
+                await asyncio.sleep(0.01)
+
+        return (
+            np.array(ids, dtype=np.int64), 
+            np.array(vectors, dtype=np.float32).reshape(-1, len(CATEGORIES)), 
+            np.array(timestamps, dtype="datetime64[ms]"),
+            np.array(found_ids, dtype=np.int64)
+        )
+
+    @staticmethod
+    def first_day(now : datetime) -> np.datetime64:
+        '''Oldest day in the index'''
+        return np.datetime64(now - timedelta(days=POSTS_SEARCH_INDEX_DAYS), "D")
+
+    @staticmethod
+    def to_datetime(day : np.datetime64) -> datetime:
+        return day.astype("datetime64[ms]").astype(datetime)
+
+    @staticmethod
+    async def set_segments(segments : dict, changed_days : list, build_timestamp : datetime) -> None:
+        '''Builds the segments of changed_days (concurrently in executors), sets and saves them'''
+        loop = asyncio.get_event_loop()
+        await asyncio.gather(*[loop.run_in_executor(None, segments[day].build) for day in changed_days])
+
+        PostsCategory.segments, PostsCategory.build_timestamp = segments, build_timestamp
+        PostsCategory.search_records = sum(len(segment) for segment in segments.values())
+        await loop.run_in_executor(None, lambda: PostsCategory.save_search_index(days=changed_days))
+
+    @staticmethod
+    def split_days(ids : np.ndarray, vectors : np.ndarray, timestamps : np.ndarray) -> dict:
+        '''Groups posts by day. Returns {day : PostsSegment} (not built)'''
+        days = timestamps.astype("datetime64[D]")
+        return {day : PostsSegment(day, ids[days == day], vectors[days == day], timestamps[days == day]) for day in np.unique(days)}
+
+    @staticmethod
+    async def create_search_index(waiting_intervall : int = 1000) -> None:
+        '''Loads all posts of the last days from the DB and creates all segments'''
+        build_timestamp = datetime.utcnow()
+        date = PostsCategory.to_datetime(PostsCategory.first_day(build_timestamp))
+        ids, vectors, timestamps, _ = await PostsCategory.load_posts({"timestamp" : {"$gte" : date}}, waiting_intervall)
+
+        segments = PostsCategory.split_days(ids, vectors, timestamps)
+        await PostsCategory.set_segments(segments, list(segments.keys()), build_timestamp)
+
+    @staticmethod
+    async def refresh_search_index() -> bool:
+        '''
+        Applies all posts categorized since the last build and drops expired days. 
+        categories_timestamp is set by the DB, build_timestamp by this host: posts of the last
+        POSTS_SEARCH_INDEX_OVERLAP seconds before the build are loaded again, so clock skew and 
+        late writes do not skip posts. Loaded posts replace their old entries (no duplicates).
+        Returns True when a segment was built again
+        '''
+        if PostsCategory.build_timestamp is None:
+            await PostsCategory.create_search_index()
+            return True
+
+        build_timestamp = datetime.utcnow()
+        first_day = PostsCategory.first_day(build_timestamp)
+        new_ids, new_vectors, new_timestamps, changed_ids = await PostsCategory.load_posts({
+            "timestamp" : {"$gte" : PostsCategory.to_datetime(first_day)},
+            "categories_timestamp" : {"$gte" : PostsCategory.build_timestamp - timedelta(seconds=POSTS_SEARCH_INDEX_OVERLAP)}
+        })
+
+        # Drop expired days
+        segments = {day : segment for day, segment in PostsCategory.segments.items() if day >= first_day}
+        changed = len(segments) < len(PostsCategory.segments)
+
+        # Remove changed posts from their segments and add the new ones. Only these days are built again
+        new_segments = PostsCategory.split_days(new_ids, new_vectors, new_timestamps)
+        for day, segment in list(segments.items()):
+            keep = ~np.isin(segment.ids, changed_ids)
+            if keep.all() and day not in new_segments:
                 continue
 
-            data = np.vstack([post["categories"]])
-            search_index.addDataPointBatch(data, ids=[int(post["_id"])])
-            records += 1 
-            if (records % waiting_intervall) == 0:     
-                await asyncio.sleep(0.01)     
-        
-        # Build and set
-        search_index.createIndex({'post': 2}, print_progress=False)
-        PostsCategory.search_index = search_index
-        PostsCategory.search_records = records
+            changed = True
+            del segments[day]
+            ids, vectors, timestamps = segment.ids[keep], segment.vectors[keep], segment.timestamps[keep]
+            if day in new_segments:
+                ids = np.concatenate([ids, new_segments[day].ids])
+                vectors = np.concatenate([vectors, new_segments[day].vectors])
+                timestamps = np.concatenate([timestamps, new_segments[day].timestamps])
+            new_segments[day] = PostsSegment(day, ids, vectors, timestamps)
+
+        changed_days = [day for day, segment in new_segments.items() if len(segment) > 0]
+        segments.update({day : new_segments[day] for day in changed_days})
+        if not changed and len(changed_days) == 0:
+            PostsCategory.build_timestamp = build_timestamp
+            return False # Nothing changed
+
+        await PostsCategory.set_segments(segments, changed_days, build_timestamp)
+        return True
+
+    @staticmethod
+    def save_search_index(directory : str = POSTS_SEARCH_INDEX_PATH, days : list = None) -> None:
+        '''
+        Saves the segments of days (all when None) and the list of segments (segments.npz). 
+        Files of dropped days are removed afterwards
+        '''
+        os.makedirs(directory, exist_ok=True)
+        for day in (PostsCategory.segments.keys() if days is None else days):
+            PostsCategory.segments[day].save(directory)
+
+        path = lambda name: os.path.join(directory, name)
+        np.savez(path("segments.tmp.npz"), days=np.array(list(PostsCategory.segments.keys()), dtype="datetime64[D]"),
+                    build_timestamp=np.datetime64(PostsCategory.build_timestamp, "ms"))
+        os.replace(path("segments.tmp.npz"), path("segments.npz"))
+
+        for filename in os.listdir(directory):
+            day = filename.split(".")[0]
+            if filename != "segments.npz" and not any(str(d) == day for d in PostsCategory.segments.keys()):
+                os.remove(path(filename))
+
+    @staticmethod
+    def load_search_index(directory : str = POSTS_SEARCH_INDEX_PATH) -> bool:
+        '''Loads the saved segments. Returns False when there are none or one is missing'''
+        if not os.path.isfile(os.path.join(directory, "segments.npz")):
+            return False
+
+        with np.load(os.path.join(directory, "segments.npz")) as arrays:
+            days, build_timestamp = arrays["days"], arrays["build_timestamp"].item()
+
+        segments = {day : PostsSegment.load(directory, day) for day in days}
+        if any(segment is None for segment in segments.values()):
+            return False
+
+        PostsCategory.segments, PostsCategory.build_timestamp = segments, build_timestamp
+        PostsCategory.search_records = sum(len(segment) for segment in segments.values())
+        return True
+
+    @staticmethod
+    async def run_search_index(intervall : int = MAX_SEARCH_INDEX_DELTA) -> None:
+        '''Loads the saved segments (or creates them) and refreshes them every intervall seconds'''
+        if not PostsCategory.load_search_index():
+            await PostsCategory.create_search_index()
+
+        while 1:
+            start_time = time.time()
+            if await PostsCategory.refresh_search_index():
+                print(f"[INFO] Built posts search index with {PostsCategory.search_records} posts in {len(PostsCategory.segments)} segments in {time.time() - start_time}s")
+            await asyncio.sleep(intervall)
+
+    @staticmethod
+    def start() -> None:
+        '''Process of the search index: keeps the saved segments in POSTS_SEARCH_INDEX_PATH up to date'''
+        MongoDBAsync.init_global(post_table=True)
+        event_loop = asyncio.get_event_loop()
+        event_loop.run_until_complete(PostsCategory.run_search_index())
+        event_loop.close()
+
+    @staticmethod
+    def search_batch(queries : np.ndarray, k : int = 100, num_threads : int = POSTS_SEARCH_THREADS, 
+                        recency_half_life : float = POSTS_SEARCH_RECENCY_HALF_LIFE) -> tuple:
+        '''
+        Searches the k nearest posts of every query (matrix [queries, categories]) in all segments concurrently and merges them.
+        With recency_half_life (in days), the similarity (1 - distance) of a post is halved for every recency_half_life days of age.
+        Returns (ids : np.array[int64] [queries, k], scores : np.array[float32] [queries, k]), every row sorted by score.
+        Rows with less than k results are filled with id -1 and score inf
+        '''
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, len(CATEGORIES))
+        segments = list(PostsCategory.segments.values())
+        if len(segments) == 0 or len(queries) == 0:
+            return (np.full((len(queries), k), -1, dtype=np.int64), np.full((len(queries), k), np.inf, dtype=np.float32))
+
+        # Fan out: one batch query per segment
+        threads = max(1, num_threads // len(segments))
+        results = list(PostsCategory.executor.map(lambda segment: segment.search(queries, k, threads), segments))
+
+        ids, scores = [], []
+        now = np.datetime64(datetime.utcnow(), "ms")
+        for segment, (rows, distances) in zip(segments, results):
+            found = rows >= 0
+            ids.append(np.where(found, segment.ids[rows], -1))
+            if recency_half_life:
+                age = (now - segment.timestamps[rows]) / np.timedelta64(1, "D")
+                distances = np.where(found, 1 - (1 - distances) * 0.5 ** (np.maximum(age, 0) / recency_half_life), np.inf)
+            scores.append(distances.astype(np.float32))
+
+        # Merge: top-k of all segments
+        ids, scores = np.concatenate(ids, axis=1), np.concatenate(scores, axis=1)
+        order = np.argsort(scores, axis=1, kind="stable")[:, :k]
+        return (np.take_along_axis(ids, order, axis=1), np.take_along_axis(scores, order, axis=1))
+
+    @staticmethod
+    def _format_results(ids : np.ndarray, scores : np.ndarray) -> list:
+        '''One row of search_batch as [{"score", "_id"}]'''
+        found = ids >= 0
+        return [{"score" : score, "_id" : _id} for _id, score in zip(ids[found].tolist(), np.round(scores[found], 3).tolist())]
 
     @staticmethod
     async def search(query_ids : list, k=100) -> dict:
         '''
-        Seaches for similar posts to given ids. Returns empty results, when search_index is none
+        Seaches for similar posts to given ids. Returns empty results, when there is no segment
         When succes, every id has k similar posts and count of records
         '''
         results = []
-        if PostsCategory.search_index:
-            results = []
-            async for post in MongoDBAsync.post_data.find({"_id" : {"$in" : query_ids}}):
-                # Get post from database
-                if post is None or post["categories"] is None or post["categories"] is False:
-                    # No post found, not categorzied or not failed categorisation
+        if PostsCategory.segments:
+            found_ids, queries = [], []
+            async for post in MongoDBAsync.post_data.find({"_id" : {"$in" : query_ids}}, projection={"categories" : 1}):
+                if post.get("categories", None) is None or post["categories"] is False:
+                    # Not categorzied or failed categorisation
                     continue
-                query = np.array(post["categories"])
+                found_ids.append(post["_id"])
+                queries.append(post["categories"])
 
-                # Start searching        
-                ids, distances = PostsCategory.search_index.knnQuery(query, k=k)
-
-                # Setup results
-                r = []
-                for i, j in sorted(zip(ids, distances), key=lambda x: x[1]):
-                    r.append({"score" : float(round(j,3)), "_id" : int(i)})
-
-                results.append({"query_id" : post["_id"], "results" : r})
+            # All queries at once
+            ids, scores = PostsCategory.search_batch(np.array(queries, dtype=np.float32), k=k)
+            for row, query_id in enumerate(found_ids):
+                results.append({"query_id" : query_id, "results" : PostsCategory._format_results(ids[row], scores[row])})
 
         return {"results" : results, "records" : PostsCategory.search_records}
 
     @staticmethod
     def search_with_categories(categories : list, k=100) -> dict:
         '''
-        Seaches for posts with given categories. Returns empty results, when search_index is none
+        Seaches for posts with given categories. Returns empty results, when there is no segment
         When succes, it returns k posts and count of records
         '''
         results = []
-        if PostsCategory.search_index:
-            query = np.array(categories)
-
-            # Start searching        
-            ids, distances = PostsCategory.search_index.knnQuery(query, k=k)
-
-            # Setup results
-            for i, j in sorted(zip(ids, distances), key=lambda x: x[1]):
-                results.append({"score" : float(round(j, 3)), "_id" : int(i)})
+        if PostsCategory.segments:
+            ids, scores = PostsCategory.search_batch(np.array([categories], dtype=np.float32), k=k)
+            results = PostsCategory._format_results(ids[0], scores[0])
 
         return {"results" : results, "records" : PostsCategory.search_records}
 
@@ -113,59 +362,67 @@ class PostsCategory():
 
 
 class AccountSearch():
+    # Lookup table: code point -> column in FREQUENZY_CHARACTERS (-1 for other characters, the last entry stands for all non-ASCII)
+    character_table = np.full(129, -1, dtype=np.int64)
+    character_table[[ord(c) for c in FREQUENZY_CHARACTERS]] = np.arange(len(FREQUENZY_CHARACTERS))
+
     @staticmethod
     def init():
-        AccountSearch.mongo_client = MongoClient(DATABASE_HOST, DATABASE_PORT, username=DATABASE_USER, password=DATABASE_PASSWORD)
+        AccountSearch.mongo_client = get_mongo_client()
         AccountSearch.account_info = AccountSearch.mongo_client[DATABASE_NAME].account_info
+        AccountSearch.accounts_table = AccountSearch.mongo_client[DATABASE_NAME].accounts
         AccountSearch.search_index = None
+        AccountSearch.names = None # index -> name (np.array[str]), built with the search_index
         AccountSearch.search_records = 0
 
     @staticmethod
-    def get_character_frequenzy(word : str) -> list:
+    def encode_names(names : list) -> np.ndarray:
+        '''Character frequenzies of all names as one matrix [names, FREQUENZY_CHARACTERS]'''
+        lengths = np.fromiter(map(len, names), dtype=np.int64, count=len(names))
+        codes = np.frombuffer(''.join(names).encode("utf-32-le"), dtype=np.uint32)
+        columns = AccountSearch.character_table[np.minimum(codes, len(AccountSearch.character_table) - 1)]
+        rows = np.repeat(np.arange(len(names)), lengths)
+
+        known = columns >= 0
+        frequenzies = np.bincount(rows[known] * len(FREQUENZY_CHARACTERS) + columns[known], minlength=len(names) * len(FREQUENZY_CHARACTERS))
+        return frequenzies.reshape(len(names), len(FREQUENZY_CHARACTERS)).astype(np.float32)
+
+    @staticmethod
+    def get_character_frequenzy(word : str) -> np.ndarray:
         '''Creates an array with the frequenzy of a character'''
-        representation = [0 for _ in FREQUENZY_CHARACTERS]
-
-        # iterate though word
-        for c in word:    
-            for index, _ in enumerate(representation):
-                # find current character index
-                if FREQUENZY_CHARACTERS[index] == c:
-                    # Found: add 1 and break this loop to get to the next char
-                    representation[index] += 1              
-                    break
+        return AccountSearch.encode_names([word])[0]
+
+    @staticmethod
+    def build_search_index() -> None:
+        '''Builds the search_index (nmslib) of all accounts in one batch and stores the index of every account (one bulk_write)'''
+        accounts = [account for account in AccountSearch.accounts_table.find({}, projection={"name" : 1, "index" : 1}) if account.get("name", None)]
 
-        return np.array(representation)
+        # index = id = record
+        search_index = nmslib.init(method='hnsw', space='cosinesimil')
+        if len(accounts) > 0:
+            search_index.addDataPointBatch(AccountSearch.encode_names([account["name"] for account in accounts]), ids=np.arange(len(accounts), dtype=np.int32))
+        search_index.createIndex({'post': 2}, print_progress=False)
+
+        # Set changed indexes
+        updates = [UpdateOne({"_id" : account["_id"]}, {"$set" : {"index" : index}}) for index, account in enumerate(accounts) if account.get("index", None) != index]
+        if len(updates) > 0:
+            AccountSearch.accounts_table.bulk_write(updates, ordered=False)
+
+        AccountSearch.search_index, AccountSearch.names = search_index, np.array([account["name"] for account in accounts], dtype=str)
+        AccountSearch.search_records = len(accounts)
 
     @staticmethod
     def create_search_index() -> None:
-        '''Generates a search_index (nmslib) of all accounts'''   
-        import nmslib
+        '''Generates a search_index (nmslib) of all accounts every 30 minutes'''
         last_indexing_count = 0    
         while 1: 
-            records = 0 # equals also to index
-            search_index = nmslib.init(method='hnsw', space='cosinesimil')
-            
             # wait until new accounts were added or the search_index is never created
             while AccountSearch.search_index and last_indexing_count == AccountSearch.accounts_table.count_documents({}):
                 time.sleep(60)
             last_indexing_count = AccountSearch.accounts_table.count_documents({})
 
-            # Process all accounts
-            for account in AccountSearch.accounts_table.find():
-                # Get character frequenzy and add it to search_index
-                representation = AccountSearch.get_character_frequenzy(account["name"])
-                data = np.vstack([representation])
-                search_index.addDataPointBatch(data, ids=[records]) # index = id = record
-
-                # Set index
-                if not "index" in account or account["index"] != records:
-                    AccountSearch.accounts_table.update_one({"name" : account["name"]}, {"$set" : {"index" : records}})
-                records += 1           
-
             # Build, set and wait
-            search_index.createIndex({'post': 2}, print_progress=False)
-            AccountSearch.search_index = search_index
-            AccountSearch.search_records = records
+            AccountSearch.build_search_index()
             time.sleep(60 * 30)
 
     @staticmethod
@@ -177,14 +434,20 @@ class AccountSearch():
         if AccountSearch.search_index:           
             # Process query, search, sort and extract indexes    
             query = AccountSearch.get_character_frequenzy(query_str)
-            ids, distances = AccountSearch.search_index.knnQuery(query, k=max)     
-            
-            for _id, _distance in zip(ids, distances):
-                acc = AccountSearch.accounts_table.find_one({"index" : int(_id)})
-                if acc and acc["name"]:# not in results:
-                    if query_str in acc["name"]:
+            ids, distances = AccountSearch.search_index.knnQuery(query, k=max)
+
+            # Names from the in-memory map, else with one query
+            if AccountSearch.names is not None:
+                names = AccountSearch.names[ids].tolist()
+            else:
+                index_names = {acc["index"] : acc["name"] for acc in AccountSearch.accounts_table.find({"index" : {"$in" : ids.tolist()}}, projection={"index" : 1, "name" : 1})}
+                names = [index_names.get(_id, None) for _id in ids.tolist()]
+
+            for name, _distance in zip(names, distances):
+                if name:
+                    if query_str in name:
                         _distance -= 1
-                    results.append((acc["name"], _distance))
+                    results.append((name, _distance))
         
         return {"results" : [zipped[0] for zipped in sorted(results, key=lambda x:x[1])] , "seconds" : (time.time() - start_time), "records" : AccountSearch.search_records}
 
@@ -0,0 +1,268 @@
+'''
+Offline benchmark of the post-processing hot path. Needs no Hive node, MongoDB or OpenSearch:
+all cases run on a fixed corpus (synthetic, or recorded with --corpus) and the results are written as JSON.
+
+    python benchmark.py                         # all cases, results into benchmark_results/
+    python benchmark.py -c html_to_text tf_idf  # some cases
+    python benchmark.py --compare benchmark_results/<old>.json
+
+Cases whose models or packages are not available (e.g. no spaCy model, no lang model) are reported as skipped.
+'''
+import argparse, json, os, platform, random, subprocess, time
+
+# In-process stand-ins of database.py instead of MongoDB and OpenSearch (post_vectorizer creates its clients on import)
+os.environ.setdefault("DATABASE_BACKEND", "memory")
+os.environ.setdefault("OPENSEARCH_BACKEND", "memory")
+
+from helper import helper, SPACY_EXCLUDED_PIPES
+from datetime import datetime
+import numpy as np
+
+CORPUS_SEED = 42
+CORPUS_SIZE = 500
+RESULTS_DIRECTORY = "benchmark_results"
+
+# Vocabulary of the synthetic corpus (some posts are spanish or german for the lang detector)
+VOCABULARY = {
+    "en" : ("the a of and to in is it that for on with as this was are be at have from my by we you not but "
+            "they all so more can one about what there when your which their will up out if just like time "
+            "hive blockchain post crypto community photo travel food day great today week life people world "
+            "first new good best market price token reward vote curation author witness power delegation "
+            "mountain beach city street coffee garden flower nature walk friends family music art game "
+            "project update development code release feature thanks support share think know love really "
+            "running fitness health recipe cooking dinner chicken rice vegetables book story writing history").split(),
+    "es" : ("el la de que y en un una los las por con para es su al lo como más pero sus le ya o este sí porque "
+            "esta entre cuando muy sin sobre también me hasta hay donde quien desde todo nos durante todos uno "
+            "comunidad foto viaje comida día hoy semana vida gente mundo amigos familia música ciudad playa").split(),
+    "de" : ("der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch es an werden "
+            "aus er hat dass sie nach wird bei einer um am sind noch wie einem über einen so zum war haben nur "
+            "heute woche leben leute welt freunde familie musik stadt strand essen reise bild gemeinschaft").split()
+}
+BENCHMARK_CASES = ["html_to_text", "pre_process_text", "tokenize_text", "predict_lang", "categorizer_cnn", "tf_idf"]
+CNN_BATCH_SIZE = 25 # posts per categorize_batch call (BATCH_SIZE of async_categorizer.categorize_posts)
+
+
+class SkipCase(Exception):
+    '''Raised by a case when its models or packages are not available'''
+    pass
+
+
+def make_sentence(rnd : random.Random, words : list) -> str:
+    sentence = ' '.join(rnd.choice(words) for _ in range(rnd.randint(4, 18)))
+    return sentence[0].upper() + sentence[1:] + rnd.choice([".", ".", ".", "!", "?"])
+
+def make_post(rnd : random.Random, index : int) -> dict:
+    '''Generates a Hive-like post: markdown with headers, images, links, lists and some html (or only plain paragraphs)'''
+    lang = rnd.choices(["en", "es", "de"], weights=[8, 1, 1])[0]
+    words = VOCABULARY[lang]
+    plain = rnd.random() < 0.3 # Plain-text posts take the fast path of html_to_text
+
+    blocks = []
+    for _ in range(rnd.randint(2, 12)):
+        paragraph = ' '.join(make_sentence(rnd, words) for _ in range(rnd.randint(1, 6)))
+        kind = "paragraph" if plain else rnd.choice(["paragraph", "paragraph", "paragraph", "header", "image", "list", "html", "link"])
+        if kind == "header":
+            blocks.append(f"{'#' * rnd.randint(1, 3)} {make_sentence(rnd, words)}")
+        elif kind == "image":
+            blocks.append(f"<center>![image](https://images.hive.blog/DQm{rnd.getrandbits(64):x}/photo{index}.jpg)</center>")
+        elif kind == "list":
+            blocks.append('\n'.join(f"- {make_sentence(rnd, words)}" for _ in range(rnd.randint(2, 5))))
+        elif kind == "html":
+            blocks.append(f"<div class=\"text-justify\">\n\n{paragraph} <b>{rnd.choice(words)}</b> &amp; <i>{rnd.choice(words)}</i>\n\n</div>")
+        elif kind == "link":
+            blocks.append(f"{paragraph} Read more on [my blog](https://peakd.com/@author{index}/post) or at @author{index + 1}.")
+        else:
+            blocks.append(paragraph)
+
+    return {
+        "title" : make_sentence(rnd, words)[:-1],
+        "body" : "\n\n".join(blocks),
+        "tags" : rnd.sample(["hive", "photography", "travel", "food", "crypto", "life", "gaming", "music"], 3),
+        "lang" : lang
+    }
+
+def make_corpus(size : int = CORPUS_SIZE, seed : int = CORPUS_SEED) -> list:
+    rnd = random.Random(seed)
+    return [make_post(rnd, index) for index in range(size)]
+
+def load_corpus(path : str) -> list:
+    '''Loads a recorded corpus: a json list or json lines of posts (at least "body", optionally "title")'''
+    with open(path, "r") as f:
+        content = f.read().strip()
+
+    posts = json.loads(content) if content.startswith("[") else [json.loads(line) for line in content.splitlines() if line.strip()]
+    return [{"title" : post.get("title", ""), "body" : post["body"], "tags" : post.get("tags", [])} for post in posts]
+
+
+# *** Cases: every case returns (function, items). The function is called once per item ***
+def post_text(post : dict) -> str:
+    return post["title"] + ". " + ' '.join(helper.html_to_text(post["body"]))
+
+def case_html_to_text(corpus : list) -> tuple:
+    return (helper.html_to_text, [post["body"] for post in corpus])
+
+def case_pre_process_text(corpus : list) -> tuple:
+    # The lemmatizer is left out: it needs the WordNet download
+    return (lambda text: helper.pre_process_text(text, lemmatize=False), [post_text(post) for post in corpus])
+
+def case_tokenize_text(corpus : list) -> tuple:
+    import spacy
+    try:
+        helper.nlp = spacy.load("en_core_web_sm", exclude=SPACY_EXCLUDED_PIPES)
+    except OSError as ex: # Model not downloaded
+        raise SkipCase(str(ex))
+
+    return (helper.tokenize_text, [helper.pre_process_text(post_text(post), lemmatize=False) for post in corpus])
+
+def case_predict_lang(corpus : list) -> tuple:
+    from network import LangDetector
+    try:
+        lang_detector = LangDetector()
+    except ValueError as ex: # Model file not found
+        raise SkipCase(str(ex))
+
+    return (lang_detector.predict_lang, [helper.pre_process_text(post_text(post), lemmatize=False) for post in corpus])
+
+def case_categorizer_cnn(corpus : list) -> tuple:
+    '''
+    async_categorizer.categorize_batch: CategorizerCNN over length-buckets of CNN_BATCH_SIZE posts.
+    Random weights and word vectors (the values do not matter for the speed), one vector per token
+    '''
+    import torch as T
+    from network import TextCNN, FakeNewsCNN, CategorizerCNN, EMBEDDING_DIM
+    from posts_analyzer import async_categorizer
+
+    T.manual_seed(CORPUS_SEED)
+    async_categorizer.statics.CATEGORIZER_CNN = CategorizerCNN.from_models(TextCNN().eval(), FakeNewsCNN().eval())
+    async_categorizer.statics.Unknown_Tokens = [np.zeros(EMBEDDING_DIM, dtype=np.float32)]
+
+    rnd = np.random.default_rng(CORPUS_SEED)
+    prepared = []
+    for index, post in enumerate(corpus):
+        tokens = helper.pre_process_text(post_text(post), lemmatize=False).split(' ')
+        vectors = list(rnd.standard_normal((len(tokens), EMBEDDING_DIM), dtype=np.float32))
+        prepared.append((index, vectors, len(tokens), 0))
+
+    return (async_categorizer.categorize_batch, [prepared[i:i + CNN_BATCH_SIZE] for i in range(0, len(prepared), CNN_BATCH_SIZE)])
+
+def case_tf_idf(corpus : list) -> tuple:
+    '''post_vectorizer: tokenize + tf-idf weighted doc vectors with an in-memory vocabulary (90% known tokens)'''
+    from posts_analyzer.post_vectorizer import tokenize, calc_weighted_vectors
+    from network import EMBEDDING_DIM
+
+    all_tokens = [tokenize({"title" : post["title"], "body" : post["body"]}) for post in corpus]
+    rnd = np.random.default_rng(CORPUS_SEED)
+    vocabulary = sorted(set(token for tokens in all_tokens for token in tokens))
+    entries = {token : (rnd.standard_normal(EMBEDDING_DIM).astype(np.float32), float(rnd.uniform(0.5, 10))) for token in vocabulary if rnd.random() < 0.9}
+
+    # Tokenizing is part of the case (like in calc_tf_idf_scores)
+    return (lambda post: calc_weighted_vectors(tokenize(post), ["en"], {"en" : entries}), [{"title" : post["title"], "body" : post["body"]} for post in corpus])
+
+
+def run_case(function, items : list, repeat : int = 1, warmup : int = 10) -> dict:
+    '''Calls function for every item (repeat times) and measures the latency of each call'''
+    for item in items[:warmup]:
+        function(item)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            call_start = time.perf_counter_ns()
+            function(item)
+            latencies.append(time.perf_counter_ns() - call_start)
+    total = time.perf_counter() - start
+
+    latencies = np.array(latencies, dtype=np.float64) / 1e6 # in ms
+    return {
+        "calls" : len(latencies),
+        "total_s" : round(total, 4),
+        "throughput_per_s" : round(len(latencies) / total, 2),
+        "mean_ms" : round(float(latencies.mean()), 4),
+        "p50_ms" : round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms" : round(float(np.percentile(latencies, 99)), 4),
+        "max_ms" : round(float(latencies.max()), 4)
+    }
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(cases : list, corpus : list, corpus_info : dict, repeat : int = 1) -> dict:
+    results = {
+        "created" : datetime.utcnow().isoformat(),
+        "commit" : get_commit(),
+        "python" : platform.python_version(),
+        "platform" : platform.platform(),
+        "corpus" : corpus_info,
+        "repeat" : repeat,
+        "cases" : {}
+    }
+
+    for name in cases:
+        try:
+            function, items = globals()[f"case_{name}"](corpus)
+        except (SkipCase, ImportError) as ex:
+            results["cases"][name] = {"skipped" : str(ex)}
+            print(f"[INFO] {name}: skipped ({ex})")
+            continue
+
+        results["cases"][name] = run_case(function, items, repeat=repeat)
+        stats = results["cases"][name]
+        print(f"[INFO] {name}: {stats['throughput_per_s']}/s | p50 {stats['p50_ms']}ms | p99 {stats['p99_ms']}ms")
+
+    return results
+
+def compare(results : dict, old_results : dict) -> None:
+    '''Prints new / old of p50, p99 and throughput for every case in both runs'''
+    print(f"Comparing with {old_results.get('commit', None)} ({old_results['created']}):")
+    for name, stats in results["cases"].items():
+        old_stats = old_results["cases"].get(name, {})
+        if "skipped" in stats or "skipped" in old_stats or not old_stats:
+            continue
+
+        ratios = ' | '.join(f"{key} x{stats[key] / old_stats[key]:.2f}" for key in ("p50_ms", "p99_ms", "throughput_per_s") if old_stats[key])
+        print(f"    {name}: {ratios}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the post-processing hot path")
+    parser.add_argument("-c", "--cases", help="cases to run (default: all)", nargs="*", choices=BENCHMARK_CASES, default=BENCHMARK_CASES)
+    parser.add_argument("-n", "--size", help="posts of the synthetic corpus", type=int, default=CORPUS_SIZE)
+    parser.add_argument("-r", "--repeat", help="passes over the corpus per case", type=int, default=1)
+    parser.add_argument("--corpus", help="recorded corpus (json list or json lines of posts) instead of the synthetic one")
+    parser.add_argument("-o", "--output", help="result file (default: benchmark_results/<time>_<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--threads", help="torch threads", type=int)
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch as T
+        T.set_num_threads(args.threads)
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+        corpus_info = {"source" : args.corpus, "size" : len(corpus)}
+    else:
+        corpus = make_corpus(args.size)
+        corpus_info = {"source" : "synthetic", "seed" : CORPUS_SEED, "size" : len(corpus)}
+
+    results = run_benchmark(args.cases, corpus, corpus_info, repeat=args.repeat)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        output = os.path.join(RESULTS_DIRECTORY, f"{datetime.utcnow():%Y%m%d-%H%M%S}_{results['commit'] or 'nocommit'}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[INFO] Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,17 @@ LANG_FASTTEXT_MODEL = "data/fasttext-lang.ftz"
 FAKENEWSCNN_MODEL_PATH = "data/FakeNewsCNN.pt"
 
 MIN_KNOWN_WORDS = 8
+WORD_VECTOR_CACHE_SIZE = 100000 # tokens per language (~120MB for 300-dim float32 vectors)
+LEMMA_CACHE_SIZE = 200000 # memoized lemmas of helper.Lemmatizer
+TOKENIZER_BATCH_SIZE = 64 # texts per batch of helper.tokenize_texts (nlp.pipe)
+TOKENIZER_N_PROCESS = 1 # processes of helper.tokenize_texts (nlp.pipe)
 
 MAX_SEARCH_INDEX_DELTA = 60 * 60 # in seconds = 1 hour
+POSTS_SEARCH_INDEX_DAYS = 10 # posts of the last x days are in the search index of agents.PostsCategory
+POSTS_SEARCH_INDEX_PATH = "data/posts_search_index" # saved search index of agents.PostsCategory
+POSTS_SEARCH_INDEX_OVERLAP = 10 * 60 # in seconds; posts categorized that long before the last build are loaded again (clock skew, late writes)
+POSTS_SEARCH_THREADS = 4 # threads of one batched kNN query (agents.PostsCategory.search_batch)
+POSTS_SEARCH_RECENCY_HALF_LIFE = None # in days; when set, older posts are ranked lower (agents.PostsCategory.search_batch)
 
 # Database (MongoDB)
 import os
@@ -29,13 +38,26 @@ DATABASE_NAME = os.environ.get("MongoDB_Name", None)
 DATABASE_USER = os.environ.get("MongoDB_User", None)
 DATABASE_PASSWORD = os.environ.get("MongoDB_Password", None)
 MONGO_CONNECTION_STR = os.environ.get("MongoDB_Connection_String", None)
+DATABASE_BACKEND = os.environ.get("DATABASE_BACKEND", "mongodb") # or "memory": in-process stand-ins of database.py (needs mongomock)
+ID_BLOCK_SIZE = 1000 # ids reserved at once by database.IdAllocator
+MAX_ID = 2**31 - 1 # highest id of database.IdAllocator: ids have to fit into int32 (numpy int32 arrays, nmslib)
+CONSISTENCY_CHUNK_SIZE = 10000 # post_info _ids per range of posts_manager.PostsCleaner
+CHAIN_FETCH_CONCURRENCY = 8 # posts fetched from the chain at the same time (posts_manager.PostsCleaner)
+CONSISTENCY_GRACE_SECONDS = 60 # found ids are checked again after that before posts_manager.PostsCleaner changes them (inserts in flight)
+VOTE_BUFFER_SIZE = 5000 # votes collected by posts_manager.VoteBuffer before they are written
+VOTE_BUFFER_SECONDS = 5 # max. age of a vote in posts_manager.VoteBuffer
 
 from opensearchpy import OpenSearch
 OPENSEARCH_HOST = os.environ.get("OPENSEARCH_HOST", None)
 OPENSEARCH_PORT = int(os.environ.get("OPENSEARCH_PORT", -1))
 OPENSEARCH_AUTH = os.environ.get("OPENSEARCH_AUTH", "user:password").split(":")
+OPENSEARCH_BACKEND = os.environ.get("OPENSEARCH_BACKEND", "opensearch") # or "memory": database.RecordingOpenSearch
 
 def get_opensearch_client() -> OpenSearch:
+    if OPENSEARCH_BACKEND == "memory":
+        from database import RecordingOpenSearch
+        return RecordingOpenSearch()
+
     return OpenSearch(
         hosts = [{'host': OPENSEARCH_HOST, 'port': OPENSEARCH_PORT}],
         http_compress = True, # enables gzip compression for request bodies
@@ -49,6 +71,7 @@ def get_opensearch_client() -> OpenSearch:
 FEED_API_PORT = int(os.environ.get("NMSLIB_API_Port", -1))
 WORDVEC_API_PORT = os.environ.get("WordVecApi_Port", 7879)
 AMABLE_DB_Port = os.environ.get("AmableDB_Port", 3399)
+WORD_VECTOR_STORE_PATH = os.environ.get("WORD_VECTOR_STORE_PATH", None) # exported by word_vectors.py
 
 print(DATABASE_HOST, DATABASE_NAME, DATABASE_USER)
 
@@ -61,6 +84,9 @@ HEARBEAT_URLS = {
 }
 
 def do_heartbeat(app_name : str, params : dict = {}):
+    if HEARBEAT_URLS[app_name] is None:
+        return None # Not configured (e.g. load tests)
+
     try:
         return requests.get(HEARBEAT_URLS[app_name], params=params)
     except Exception as e:
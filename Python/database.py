@@ -1,12 +1,32 @@
 import pymongo
 import motor.motor_asyncio
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo import ReturnDocument
+from pymongo.results import BulkWriteResult
 
 from config import *
 
+from collections import Counter
+import threading, json, copy
+import numpy as np
+
+
+def get_mongo_client():
+    '''pymongo-Client of the configured backend (DATABASE_BACKEND)'''
+    if DATABASE_BACKEND == "memory":
+        return MemoryMongoClient(is_async=False)
+    return pymongo.MongoClient(MONGO_CONNECTION_STR)
+
+def get_motor_client():
+    '''motor-Client of the configured backend (DATABASE_BACKEND)'''
+    if DATABASE_BACKEND == "memory":
+        return MemoryMongoClient(is_async=True)
+    return motor.motor_asyncio.AsyncIOMotorClient(MONGO_CONNECTION_STR)
+
 
 class MongoDBAsync:
     def __init__(self, post_table : bool = False, account_table : bool = False, banned_table : bool = False, stats_table : bool = False) -> None:
-        self.mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_CONNECTION_STR)
+        self.mongo_client = get_motor_client()
 
         if post_table:
             self.post_table = self.mongo_client[DATABASE_NAME].posts # OLD
@@ -25,7 +45,7 @@ class MongoDBAsync:
             
     @staticmethod
     def init_global(post_table : bool = False, account_table : bool = False, banned_table : bool = False, stats_table : bool = False) -> None:
-        MongoDBAsync.mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_CONNECTION_STR)
+        MongoDBAsync.mongo_client = get_motor_client()
 
         if post_table:
             MongoDBAsync.post_table = MongoDBAsync.mongo_client[DATABASE_NAME].posts
@@ -33,10 +53,12 @@ class MongoDBAsync:
             MongoDBAsync.post_data = MongoDBAsync.mongo_client[DATABASE_NAME].post_data
             MongoDBAsync.post_text = MongoDBAsync.mongo_client[DATABASE_NAME].post_text
             MongoDBAsync.post_replies = MongoDBAsync.mongo_client[DATABASE_NAME].post_replies
+            MongoDBAsync.post_ids = IdAllocator(MongoDBAsync.mongo_client[DATABASE_NAME].counters, MongoDBAsync.post_info)
         if account_table:
             MongoDBAsync.account_table = MongoDBAsync.mongo_client[DATABASE_NAME].accounts
             MongoDBAsync.account_info = MongoDBAsync.mongo_client[DATABASE_NAME].account_info
             MongoDBAsync.account_data = MongoDBAsync.mongo_client[DATABASE_NAME].account_data
+            MongoDBAsync.account_ids = IdAllocator(MongoDBAsync.mongo_client[DATABASE_NAME].counters, MongoDBAsync.account_info)
         if stats_table:
             MongoDBAsync.stats_table = MongoDBAsync.mongo_client[DATABASE_NAME].stats
         if banned_table:
@@ -45,7 +67,7 @@ class MongoDBAsync:
     
 class MongoDB:
     def __init__(self, post_table : bool = False, account_table : bool = False, banned_table : bool = False, stats_table : bool = False, post_replies : bool = False) -> None:
-        self.mongo_client = pymongo.MongoClient(MONGO_CONNECTION_STR)
+        self.mongo_client = get_mongo_client()
 
         if post_table:
             self.post_table = self.mongo_client[DATABASE_NAME].posts
@@ -60,7 +82,7 @@ class MongoDB:
 
     @staticmethod
     def init_global(post_table : bool = False, account_table : bool = False, banned_table : bool = False, stats_table : bool = False) -> None:
-        MongoDB.mongo_client = pymongo.MongoClient(MONGO_CONNECTION_STR)
+        MongoDB.mongo_client = get_mongo_client()
 
         if post_table:
             MongoDB.post_info = MongoDB.mongo_client[DATABASE_NAME].post_info
@@ -75,4 +97,318 @@ class MongoDB:
             MongoDB.stats_table = MongoDB.mongo_client[DATABASE_NAME].stats
         if banned_table:
             MongoDB.banned_table = MongoDB.mongo_client[DATABASE_NAME].banned
-            
+
+
+class IdAllocator:
+    '''
+    Hands out unused ids of a collection. Blocks of ids are reserved with one atomic $inc on a counter document
+    (counters collection, _id = "<collection>.<field>"), so processes never get the same id and no id has to be probed.
+    The counter starts above the highest id in the collection (older ids were random below 2e9, 
+    so the counter starts near 2e9). Ids never exceed MAX_ID (int32), an exhausted counter raises an OverflowError.
+    Works with pymongo (allocate) and motor (allocate_async) collections.
+    '''
+    def __init__(self, counters, collection, field : str = "_id", block_size : int = ID_BLOCK_SIZE) -> None:
+        self.counters, self.collection, self.field = counters, collection, field
+        self.name = f"{collection.name}.{field}"
+        self.block_size = block_size
+        self.next_id, self.end_id = 0, 0 # reserved block: [next_id, end_id)
+
+    def take(self, amount : int) -> list:
+        '''Takes up to amount ids of the reserved block'''
+        ids = list(range(self.next_id, min(self.end_id, self.next_id + amount)))
+        self.next_id += len(ids)
+        return ids
+
+    def reserve_args(self, amount : int) -> tuple:
+        size = max(self.block_size, amount)
+        return (size, ({"_id" : self.name}, {"$inc" : {"next" : size}}), {"return_document" : ReturnDocument.AFTER})
+
+    def set_block(self, counter : dict, size : int) -> None:
+        if counter["next"] - size > MAX_ID:
+            raise OverflowError(f"IdAllocator {self.name}: no ids left up to MAX_ID ({MAX_ID})")
+        self.next_id, self.end_id = counter["next"] - size, min(counter["next"], MAX_ID + 1)
+
+    def seed_args(self, highest : dict) -> tuple:
+        '''Update of the counter when it does not exist yet ($max: processes seeding at the same time agree)'''
+        start = highest[self.field] + 1 if highest and isinstance(highest.get(self.field, None), int) else 0
+        return ({"_id" : self.name}, {"$max" : {"next" : start}})
+
+    def allocate(self, amount : int = 1) -> list:
+        '''Returns amount unused ids'''
+        ids = self.take(amount)
+        while len(ids) < amount:
+            size, args, kwargs = self.reserve_args(amount - len(ids))
+            counter = self.counters.find_one_and_update(*args, **kwargs)
+            if counter is None:
+                # First allocation: start above the highest id
+                if self.field != "_id":
+                    self.collection.create_index(self.field) # the sort below must not scan the collection
+                highest = self.collection.find_one({}, {self.field : 1}, sort=[(self.field, -1)])
+                try:
+                    self.counters.update_one(*self.seed_args(highest), upsert=True)
+                except DuplicateKeyError:
+                    pass # seeded by another process
+                continue
+
+            self.set_block(counter, size)
+            ids += self.take(amount - len(ids))
+        return ids
+
+    async def allocate_async(self, amount : int = 1) -> list:
+        '''Returns amount unused ids (motor)'''
+        ids = self.take(amount)
+        while len(ids) < amount:
+            size, args, kwargs = self.reserve_args(amount - len(ids))
+            counter = await self.counters.find_one_and_update(*args, **kwargs)
+            if counter is None:
+                # First allocation: start above the highest id
+                if self.field != "_id":
+                    await self.collection.create_index(self.field) # the sort below must not scan the collection
+                highest = await self.collection.find_one({}, {self.field : 1}, sort=[(self.field, -1)])
+                try:
+                    await self.counters.update_one(*self.seed_args(highest), upsert=True)
+                except DuplicateKeyError:
+                    pass # seeded by another process
+                continue
+
+            self.set_block(counter, size)
+            ids += self.take(amount - len(ids))
+        return ids
+
+
+
+#   *** In-memory Backends (DATABASE_BACKEND / OPENSEARCH_BACKEND = "memory") ***
+#   Local stand-ins for load tests: all clients of a process share one mongomock store,
+#   every request and the written bytes are counted in BackendStats.
+class BackendStats:
+    queries = Counter() # {"post_data.find" : count}
+    bytes_written = Counter() # {"mongodb" : bytes, "opensearch" : bytes}
+    lock = threading.Lock()
+
+    @staticmethod
+    def count(query : str, backend : str = None, written : int = 0) -> None:
+        with BackendStats.lock:
+            BackendStats.queries[query] += 1
+            if backend:
+                BackendStats.bytes_written[backend] += written
+
+    @staticmethod
+    def reset() -> None:
+        with BackendStats.lock:
+            BackendStats.queries.clear()
+            BackendStats.bytes_written.clear()
+
+    @staticmethod
+    def snapshot() -> dict:
+        with BackendStats.lock:
+            return {
+                "queries" : dict(BackendStats.queries), 
+                "queries_total" : sum(BackendStats.queries.values()), 
+                "bytes_written" : dict(BackendStats.bytes_written)
+            }
+
+def json_default(obj):
+    '''Like the serializer of opensearchpy (numpy arrays and scalars)'''
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return str(obj)
+
+def bson_size(document) -> int:
+    import bson
+    try:
+        return len(bson.encode(document))
+    except Exception: # not encodable (e.g. numpy values): close enough for stats
+        return len(json.dumps(document, default=json_default).encode())
+
+def write_size(request) -> int:
+    '''Bytes of a document, a list of documents or a pymongo bulk-operation (UpdateOne, InsertOne...)'''
+    if isinstance(request, (list, tuple)):
+        return sum(write_size(item) for item in request)
+    if isinstance(request, dict):
+        return bson_size(request)
+
+    return sum(bson_size(getattr(request, attr)) for attr in ("_filter", "_doc") if isinstance(getattr(request, attr, None), dict))
+
+
+class MemoryCursor():
+    '''Lazy find-cursor (sort, skip, limit), which is executed on the first iteration'''
+    def __init__(self, collection, args : tuple, kwargs : dict) -> None:
+        self.collection, self.args, self.kwargs = collection, args, kwargs
+        self.modifiers = [] # [(method, args)]
+        self.documents = None
+
+    def sort(self, *args, **kwargs):
+        self.modifiers.append(("sort", args, kwargs))
+        return self
+
+    def skip(self, *args, **kwargs):
+        self.modifiers.append(("skip", args, kwargs))
+        return self
+
+    def limit(self, *args, **kwargs):
+        self.modifiers.append(("limit", args, kwargs))
+        return self
+
+    def execute(self) -> list:
+        if self.documents is None:
+            with MemoryMongoClient.lock:
+                cursor = self.collection.find(*self.args, **self.kwargs)
+                for method, args, kwargs in self.modifiers:
+                    cursor = getattr(cursor, method)(*args, **kwargs)
+                self.documents = list(cursor)
+        return self.documents
+
+    def __iter__(self):
+        return iter(self.execute())
+
+    def __aiter__(self):
+        return self.iterate_async()
+
+    async def iterate_async(self):
+        for document in self.execute():
+            yield document
+
+    async def to_list(self, length : int = None) -> list:
+        return self.execute()[:length]
+
+
+class MemoryCollection():
+    '''pymongo / motor like collection on top of a mongomock-collection'''
+    WRITES = {"insert_one", "insert_many", "update_one", "update_many", "replace_one", "delete_one", "delete_many", 
+                "bulk_write", "find_one_and_update", "find_one_and_replace", "find_one_and_delete", "create_index"}
+    READS = {"find_one", "count_documents", "estimated_document_count", "distinct"}
+
+    def __init__(self, collection, is_async : bool) -> None:
+        self.collection, self.is_async = collection, is_async
+        self.name = collection.name
+
+    def find(self, *args, **kwargs) -> MemoryCursor:
+        BackendStats.count(f"{self.name}.find")
+        if isinstance(kwargs.get("projection", None), tuple):
+            kwargs["projection"] = list(kwargs["projection"])
+        return MemoryCursor(self.collection, args, kwargs)
+
+    def aggregate(self, pipeline : list, **kwargs) -> MemoryCursor:
+        BackendStats.count(f"{self.name}.aggregate")
+        cursor = MemoryCursor(self.collection, (), {})
+        with MemoryMongoClient.lock:
+            cursor.documents = list(self.collection.aggregate(copy.deepcopy(pipeline), **kwargs)) # mongomock changes the stages
+        return cursor
+
+    def bulk_write_sync(self, requests : list, ordered : bool = True, **kwargs):
+        '''Applies the pymongo bulk-operations one by one. Failed ones raise a BulkWriteError with pymongo-like details'''
+        details = {"writeErrors" : [], "writeConcernErrors" : [], "nInserted" : 0, "nUpserted" : 0, "nMatched" : 0, "nModified" : 0, "nRemoved" : 0, "upserted" : []}
+        for index, request in enumerate(requests):
+            operation = type(request).__name__
+            try:
+                if operation == "InsertOne":
+                    self.collection.insert_one(request._doc)
+                    details["nInserted"] += 1
+                elif operation in ("UpdateOne", "UpdateMany", "ReplaceOne"):
+                    method = {"UpdateOne" : self.collection.update_one, "UpdateMany" : self.collection.update_many, "ReplaceOne" : self.collection.replace_one}[operation]
+                    result = method(request._filter, request._doc, upsert=bool(getattr(request, "_upsert", False)))
+                    details["nMatched"] += result.matched_count
+                    details["nModified"] += result.modified_count
+                    if result.upserted_id is not None:
+                        details["nUpserted"] += 1
+                        details["upserted"].append({"index" : index, "_id" : result.upserted_id})
+                elif operation in ("DeleteOne", "DeleteMany"):
+                    method = self.collection.delete_one if operation == "DeleteOne" else self.collection.delete_many
+                    details["nRemoved"] += method(request._filter).deleted_count
+                else:
+                    raise TypeError(f"{operation} is not a valid request")
+            except TypeError:
+                raise
+            except Exception as ex:
+                details["writeErrors"].append({"index" : index, "code" : getattr(ex, "code", None), "errmsg" : str(ex), "op" : getattr(request, "_doc", None)})
+                if ordered:
+                    break
+
+        if len(details["writeErrors"]) > 0:
+            raise BulkWriteError(details)
+        return BulkWriteResult(details, True)
+
+    def __getattr__(self, name : str):
+        if name not in self.WRITES and name not in self.READS:
+            return getattr(self.collection, name)
+
+        method = self.bulk_write_sync if name == "bulk_write" else getattr(self.collection, name)
+        def call(*args, **kwargs):
+            if name in self.WRITES:
+                BackendStats.count(f"{self.name}.{name}", "mongodb", write_size([arg for arg in args if isinstance(arg, (dict, list))]))
+            else:
+                BackendStats.count(f"{self.name}.{name}")
+
+            with MemoryMongoClient.lock:
+                return method(*args, **kwargs)
+
+        if not self.is_async:
+            return call
+
+        async def call_async(*args, **kwargs):
+            return call(*args, **kwargs)
+        return call_async
+
+
+class MemoryDatabase():
+    def __init__(self, database, is_async : bool) -> None:
+        self.database, self.is_async = database, is_async
+
+    def __getitem__(self, name : str) -> MemoryCollection:
+        return MemoryCollection(self.database[name], self.is_async)
+
+    def __getattr__(self, name : str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_collection_names(self):
+        with MemoryMongoClient.lock:
+            names = self.database.list_collection_names()
+        if not self.is_async:
+            return names
+
+        async def result():
+            return names
+        return result()
+
+
+class MemoryMongoClient():
+    '''pymongo-Client (is_async=False) or motor-Client (is_async=True) of the shared in-memory store'''
+    store = None # mongomock.MongoClient
+    lock = threading.RLock() # mongomock is not thread-safe
+
+    def __init__(self, is_async : bool = False) -> None:
+        import mongomock
+        with MemoryMongoClient.lock:
+            if MemoryMongoClient.store is None:
+                MemoryMongoClient.store = mongomock.MongoClient()
+        self.is_async = is_async
+
+    def __getitem__(self, name : str) -> MemoryDatabase:
+        return MemoryDatabase(MemoryMongoClient.store[name], self.is_async)
+
+    def __getattr__(self, name : str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    @staticmethod
+    def drop() -> None:
+        '''Removes all data'''
+        with MemoryMongoClient.lock:
+            MemoryMongoClient.store = None
+
+
+class RecordingOpenSearch():
+    '''Stand-in for the OpenSearch-Client: records all bulk-requests'''
+    def __init__(self) -> None:
+        self.actions = [] # [(index, [actions and documents])]
+
+    def bulk(self, body : list, index : str = None, **kwargs) -> dict:
+        payload = ''.join(json.dumps(line, default=json_default) + '\n' for line in body)
+        BackendStats.count(f"opensearch.{index}.bulk", "opensearch", len(payload.encode()))
+        self.actions.append((index, body))
+        return {"took" : 0, "errors" : False, "items" : []}
@@ -1,65 +1,80 @@
 from config import *
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
+from html.entities import html5
 
-import time
+import asyncio, threading
 import re, string
 import markdown
 
+# Precompiled patterns and tables for helper.pre_process_text
+LINK_PATTERN = re.compile(r'^https?:\/\/.*[\r\n]*', flags=re.MULTILINE)
+MARKDOWN_LINK_PATTERN = re.compile(r'[\(\[].*?[\)\]]', flags=re.MULTILINE)
+NON_ASCII_PATTERN = re.compile(r'[^\x00-\x7F]+')
+MENTION_PATTERN = re.compile(r'@\w+')
+WHITESPACES_PATTERN = re.compile(r'\s{2,}')
+PRE_PROCESS_TABLE_1 = str.maketrans({'?' : '.', '!' : '.', '\n' : ' ', '#' : None, '-' : ' ', "'" : ' '})
+PRE_PROCESS_TABLE_2 = str.maketrans({':' : '.', ';' : ' '})
+SPACY_EXCLUDED_PIPES = ["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer", "ner"]
+PUNCTUATION_DIGITS_TABLE = str.maketrans({**{c : ' ' for c in string.punctuation}, **{c : None for c in string.digits}})
+
+# Bodies without any match are plain paragraphs for markdown (see helper.html_to_text)
+MARKUP_PATTERN = re.compile(r'[\\`*_\[\]<>&\t\r\x02\x03]|^[ \-+=#]|^\d+[.)]|  $', flags=re.MULTILINE)
+
 class helper:
     @staticmethod
     def init(load_nlp = True) -> None:     
         if load_nlp:
             import spacy
-            helper.nlp = spacy.load("en_core_web_sm")
+            # Tokenizer-only pipeline (only token.text is used)
+            helper.nlp = spacy.load("en_core_web_sm", exclude=SPACY_EXCLUDED_PIPES)
             import nltk
             nltk.download("wordnet")
 
     @staticmethod
-    def html_to_text(html : str) -> str:
-        '''Converts Markdown to html and html to plain text'''
+    def html_to_text(html : str) -> list:
+        '''Converts Markdown to html and html to plain text. Returns the text nodes (like BeautifulSoup.findAll(text=True))'''
+        if not MARKUP_PATTERN.search(html):
+            # Fast path: markdown would only wrap the paragraphs into <p> (joined by '\n')
+            texts = []
+            for block in (html + "\n\n").split("\n\n"):
+                if block.strip():
+                    texts += [block.lstrip(), '\n']
+            return texts[:-1]
+
         try:
             html = markdown.markdown(html)
         except:
             pass
         
         try:
-            return BeautifulSoup(html, features="html.parser").findAll(text=True)
+            return TextExtractor.extract(html)
         except:
             return str(html)
 
     @staticmethod
-    def pre_process_text(text : str, lmtz = None) -> str:
-        '''Process Text to fit into models'''
+    def pre_process_text(text : str, lmtz = None, lemmatize : bool = True) -> str:
+        '''Process Text to fit into models. lemmatize=False skips the (blocking) lemmatizer'''
+        text = LINK_PATTERN.sub(' ', text)  # Remove simple Links
+        text = MARKDOWN_LINK_PATTERN.sub(' ', text) # Remove Markdown for Images and Links
 
-        text = re.sub(r'^https?:\/\/.*[\r\n]*', ' ', text, flags=re.MULTILINE)  # Remove simple Links
-        text = re.sub(r'[\(\[].*?[\)\]]', ' ', text, flags=re.MULTILINE) # Remove Markdown for Images and Links
-
-        # Replace other characters
-        text = text.replace('?', '.').replace('!', '.')
-        text = text.replace('\n', ' ')
-        text = text.replace('#', '').replace('-', ' ')
-        text = text.replace("'", ' ').replace(", ", ' ').replace(':', '.').replace(';', ' ')
+        # Replace other characters (order matters: '$ ' and ' $' see the spaces of the replacements before)
+        text = text.translate(PRE_PROCESS_TABLE_1).replace(", ", ' ').translate(PRE_PROCESS_TABLE_2)
         text = text.replace('$ ', ' dollar ').replace(' $', ' dollar ')
         text = text.replace('€ ', ' euro ').replace(' €', ' euro ')
         text = text.replace('%', " percentage ")
 
-        # Remove whitespaces
-        while '  ' in text:
-            text = text.replace('  ', ' ')
-
-        # Remove multiple points
-        text = text.replace(' .', '.')
-        while '..' in text:
-            text = text.replace('..', '.')
-
+        # Runs of whitespaces and points do not need to be removed here: 
+        # points become whitespaces and all whitespaces are merged at the end
         text = text.lower()
-        text = re.sub(r'[^\x00-\x7F]+', ' ', text)
-        text = re.sub(r'@\w+', '', text)  
-        text = re.sub(r'[%s]' % re.escape(string.punctuation), ' ', text)
-        text = re.sub(r'[0-9]', '', text)
-        text = re.sub(r'\s{2,}', ' ', text)
+        if not text.isascii():
+            text = NON_ASCII_PATTERN.sub(' ', text)
+        text = MENTION_PATTERN.sub('', text)
+        text = text.translate(PUNCTUATION_DIGITS_TABLE) # punctuation -> ' ' and remove digits
+        text = WHITESPACES_PATTERN.sub(' ', text)
 
         # Lemmatize
+        if not lemmatize:
+            return text
         if lmtz is None:
             text = statics.LEMMATIZER.lemmatize(text)
         else:
@@ -70,29 +85,16 @@ class helper:
     @staticmethod
     def tokenize_text(text : str) -> list:
         '''Tokenize a text and return it'''
-        # Prepare Text
-        import ftfy    
-        doc_text = ftfy.fix_text(text)
+        return helper.tokenize_texts([text], n_process=1)[0]
 
-        # Tokenize
-        doc = helper.nlp(doc_text)
-        return [token.text for token in doc]
-        
-        # OLD
+    @staticmethod
+    def tokenize_texts(texts : list, batch_size : int = TOKENIZER_BATCH_SIZE, n_process : int = TOKENIZER_N_PROCESS) -> list:
+        '''Tokenize many texts at once (nlp.pipe) and return a list of tokens for every text'''
         import ftfy
-        tok_text = [] 
-        text = [ftfy.fix_text(text)]
 
-        #Tokenising using SpaCy:
-        for doc in helper.nlp.pipe(text, disable=["tagger", "parser","ner"]):
-            tok = [t.text for t in doc if (t.is_ascii and not t.is_punct and not t.is_space)]
-            if len(tok) > 1:
-                tok_text.append(tok)
-
-        if len(tok_text) > 0:
-            return tok_text[0]
-        else:
-            return []
+        # Prepare Texts (as a stream) and Tokenize
+        doc_texts = (ftfy.fix_text(text) for text in texts)
+        return [[token.text for token in doc] for doc in helper.nlp.pipe(doc_texts, batch_size=batch_size, n_process=n_process)]
 
     @staticmethod
     def count_in_list(l : list, value) -> int:
@@ -103,17 +105,157 @@ class helper:
 
         return counter
 
+    @staticmethod
+    def index_positions(keys : list) -> dict:
+        '''Returns {key : [indexes]} to set results of a query in O(1) per document (keys can occur more than once)'''
+        positions = {}
+        for index, key in enumerate(keys):
+            positions.setdefault(key, []).append(index)
+
+        return positions
+
 class Lemmatizer():
-    def __init__(self):
+    '''
+    Lemmatizes token by token (WordNet) and memoizes all lemmas in a bounded dict.
+    Thread-safe without waiting: only the first call loads WordNet under a lock
+    '''
+    def __init__(self, max_size : int = LEMMA_CACHE_SIZE):
         from nltk.stem.wordnet import WordNetLemmatizer
         self.lmmze = WordNetLemmatizer()
-        self.working = False
+        self.lemmas = {} # {token : lemma}
+        self.max_size = max_size
+        self.loaded, self.loading_lock = False, threading.Lock()
+
+    def load(self) -> None:
+        # WordNet is loaded lazily and that is not thread-safe
+        with self.loading_lock:
+            if not self.loaded:
+                self.lmmze.lemmatize("loading")
+                self.loaded = True
+
+    def lemmatize_token(self, token : str) -> str:
+        lemma = self.lemmas.get(token, None)
+        if lemma is None:
+            if not self.loaded:
+                self.load()
+
+            lemma = self.lmmze.lemmatize(token) if token else token
+            if len(self.lemmas) >= self.max_size:
+                self.lemmas.clear() # Keeps the table bounded (vocabulary is refilled fast)
+            self.lemmas[token] = lemma
+        return lemma
 
     def lemmatize(self, text : str) -> str:
-        while self.working:
-            time.sleep(0.1)
+        return ' '.join([self.lemmatize_token(token) for token in text.split(' ')])
 
-        self.working = True
-        text = self.lmmze.lemmatize(text)
-        self.working = False
-        return text
+    async def lemmatize_async(self, text : str) -> str:
+        '''Lemmatize without blocking the event loop: only texts with unknown tokens go to an executor'''
+        if all(token in self.lemmas for token in text.split(' ')):
+            return self.lemmatize(text)
+
+        return await asyncio.get_event_loop().run_in_executor(None, self.lemmatize, text)
+
+class TextExtractor(HTMLParser):
+    '''
+    Streams the text nodes out of html without building a tree.
+    Yields the same strings as BeautifulSoup(html, features="html.parser").findAll(text=True) 
+    (comments, declarations and whitespace handling included)
+    '''
+    ASCII_SPACES = ' \n\t\x0c\r'
+    EMPTY_ELEMENT_TAGS = {'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image', 'img', 
+                            'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr'}
+    PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+    ENTITIES = {name.rstrip(';') : char for name, char in reversed(list(html5.items()))}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.texts, self.current_data = [], []
+        self.open_tags = [] # names of all open tags
+        self.preserve_whitespace = 0 # open <pre> and <textarea> tags
+        self.already_closed_empty_elements = [] # <br> is closed immediately, a later </br> is ignored
+
+    @staticmethod
+    def extract(html : str) -> list:
+        parser = TextExtractor()
+        parser.feed(html)
+        parser.close()
+        parser.end_data()
+        return parser.texts
+
+    def end_data(self) -> None:
+        if not self.current_data:
+            return
+
+        data = ''.join(self.current_data)
+        self.current_data = []
+        if not self.preserve_whitespace and not data.strip(self.ASCII_SPACES):
+            # Whitespaces only: replaced with a single newline or space
+            data = '\n' if '\n' in data else ' '
+        if data:
+            self.texts.append(data)
+
+    def pop_to_tag(self, tag : str) -> None:
+        if tag not in self.open_tags:
+            return
+
+        while True:
+            name = self.open_tags.pop()
+            if name in self.PRESERVE_WHITESPACE_TAGS:
+                self.preserve_whitespace -= 1
+            if name == tag:
+                break
+
+    def handle_starttag(self, tag, attrs, handle_empty_element : bool = True) -> None:
+        self.end_data()
+        self.open_tags.append(tag)
+        if tag in self.PRESERVE_WHITESPACE_TAGS:
+            self.preserve_whitespace += 1
+
+        if handle_empty_element and tag in self.EMPTY_ELEMENT_TAGS:
+            self.handle_endtag(tag, check_already_closed=False)
+            self.already_closed_empty_elements.append(tag)
+
+    def handle_startendtag(self, tag, attrs) -> None:
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed : bool = True) -> None:
+        if check_already_closed and tag in self.already_closed_empty_elements:
+            self.already_closed_empty_elements.remove(tag)
+        else:
+            self.end_data()
+            self.pop_to_tag(tag)
+
+    def handle_data(self, data) -> None:
+        self.current_data.append(data)
+
+    def handle_charref(self, name) -> None:
+        number = int(name[1:], 16) if name[0] in "xX" else int(name)
+        if number == 0 or number > 0x10FFFF or 0xD800 <= number <= 0xDFFF:
+            char = "\ufffd"
+        elif 0x80 <= number <= 0x9F:
+            # Mostly meant as windows-1252 (&#150; -> '–')
+            char = bytes([number]).decode("cp1252", errors="ignore") or chr(number)
+        else:
+            char = chr(number)
+        self.current_data.append(char)
+
+    def handle_entityref(self, name) -> None:
+        self.current_data.append(self.ENTITIES.get(name, f"&{name}"))
+
+    def handle_special(self, data : str) -> None:
+        self.end_data()
+        self.current_data.append(data)
+        self.end_data()
+
+    def handle_comment(self, data) -> None:
+        self.handle_special(data)
+
+    def handle_decl(self, decl) -> None:
+        self.handle_special(decl[len("DOCTYPE "):])
+
+    def unknown_decl(self, data) -> None:
+        self.handle_special(data[len("CDATA["):] if data.upper().startswith("CDATA[") else data)
+
+    def handle_pi(self, data) -> None:
+        self.handle_special(data)
@@ -1,7 +1,7 @@
 from helper import helper
 from agents import *
 from config import *
-from database import MongoDBAsync
+from database import MongoDBAsync, IdAllocator
 
 from beem import Hive 
 from beem.nodelist import NodeList
@@ -24,6 +24,8 @@ instance = Hive(node=NodeList().get_nodes(hive=True))
 
 
 class PostsManager():
+    post_ids, post_ids_async = None, None # IdAllocator of the post_id field (pymongo / motor)
+
     def __init__(self) -> None:
         self.mongo_client = MongoClient(DATABASE_HOST, DATABASE_PORT, username=DATABASE_NAME, password=DATABASE_PASSWORD)
         self.post_table = self.mongo_client[DATABASE_NAME].posts
@@ -87,8 +89,9 @@ class PostsManager():
 
         if not inside_post:
             # Create unused post_id
-            while "post_id" not in post_obj or post_table.find_one({"post_id" : post_obj["post_id"]}):
-                post_obj["post_id"] = secrets.randbelow(2000000000)
+            if PostsManager.post_ids is None:
+                PostsManager.post_ids = IdAllocator(post_table.database.counters, post_table, field="post_id")
+            post_obj["post_id"] = PostsManager.post_ids.allocate()[0]
         else:
             # Retake post_id
             post_obj["post_id"] = inside_post["post_id"]
@@ -225,8 +228,9 @@ class PostsManager():
             categories_doc = None 
 
             if post_ids[index] == 0:
-                while post_ids[index] == 0 or await MongoDBAsync.post_table.find_one({"post_id" : post_ids[index]}):
-                    post_ids[index] = secrets.randbelow(2000000000)
+                if PostsManager.post_ids_async is None:
+                    PostsManager.post_ids_async = IdAllocator(MongoDBAsync.post_table.database.counters, MongoDBAsync.post_table, field="post_id")
+                post_ids[index] = (await PostsManager.post_ids_async.allocate_async())[0]
 
             if "created" in post:
                 timestamp = post["created"]
@@ -498,12 +502,12 @@ class AccountsManager():
             if len(acc_posts) > 0:
                 # Get similar posts like his own
                 own_post_ids = [secrets.choice(acc_posts) for x in range(0, secrets.randbelow(len(acc_posts)))]
-                similar_posts += PostsCategory.search(own_post_ids, k=30)["results"]
+                similar_posts += (await PostsCategory.search(own_post_ids, k=30))["results"]
                 
             if len(acc_votes) > 0:
                 # Get similar posts like he voted
                 voted_post_ids = [secrets.choice(acc_votes) for x in range(0, secrets.randbelow(len(acc_votes)))]
-                similar_posts += PostsCategory.search(voted_post_ids, k=20)["results"]
+                similar_posts += (await PostsCategory.search(voted_post_ids, k=20))["results"]
 
             # Extrace Similar Post IDs
             open_ids = []
@@ -0,0 +1,151 @@
+'''
+Load test of the workers (lang detector, categorizer, vectorizer) without a live cluster:
+MongoDB and OpenSearch are replaced by the in-memory backends of database.py (needs mongomock).
+N synthetic posts (see benchmark.py) are pushed through every worker, one after another like in production.
+Reports posts/sec, queries issued and bytes written per worker as JSON.
+
+    python load_test.py -n 500 [-w lang_detector categorizer vectorizer] [-o load_test.json]
+
+Workers whose models are not available are reported as skipped (the posts get their langs from the corpus then).
+'''
+import os
+os.environ["DATABASE_BACKEND"] = "memory"
+os.environ["OPENSEARCH_BACKEND"] = "memory"
+os.environ["MongoDB_Name"] = "hive-discover" # the vectorizer uses this name
+
+import argparse, asyncio, json, time
+from datetime import datetime
+import numpy as np
+
+from config import *
+from database import BackendStats, get_mongo_client
+from helper import helper
+from benchmark import VOCABULARY, CORPUS_SEED, make_corpus
+
+WORKERS = ["lang_detector", "categorizer", "vectorizer"]
+KNOWN_TOKENS = 0.9 # share of the vocabulary with word vectors
+
+
+def seed(corpus : list) -> None:
+    '''Inserts the corpus into post_data / post_text (like posts_manager.append_posts) and word vectors into fasttext'''
+    mongo_client = get_mongo_client()
+    timestamp = datetime.utcnow()
+    mongo_client[DATABASE_NAME].post_data.insert_many([
+        {"_id" : post_id, "categories" : None, "lang" : None, "timestamp" : timestamp} for post_id in range(len(corpus))
+    ])
+    mongo_client[DATABASE_NAME].post_text.insert_many([
+        {"_id" : post_id, "title" : post["title"], "body" : ' '.join(helper.html_to_text(post["body"])), "tag_str" : ' '.join(post["tags"]), "timestamp" : timestamp}
+        for post_id, post in enumerate(corpus)
+    ])
+
+    from network import EMBEDDING_DIM
+    rnd = np.random.default_rng(CORPUS_SEED)
+    for lang, words in VOCABULARY.items():
+        tokens = sorted(set(word.lower() for word in words) | {"(", "unknown", ")", ".", ","})
+        mongo_client["fasttext"][lang].insert_many([
+            {"_id" : token, "v" : rnd.standard_normal(EMBEDDING_DIM).astype(np.float32).tobytes(), "idf" : float(rnd.uniform(0.5, 10))}
+            for token in tokens if token in ("(", "unknown", ")") or rnd.random() < KNOWN_TOKENS
+        ])
+
+def set_langs(corpus : list) -> None:
+    '''Langs from the corpus (when the lang detector did not run)'''
+    from pymongo import UpdateOne
+    get_mongo_client()[DATABASE_NAME].post_data.bulk_write([
+        UpdateOne({"_id" : post_id, "lang" : None}, {"$set" : {"lang" : [{"lang" : post["lang"], "x" : 1.0}]}}) for post_id, post in enumerate(corpus)
+    ])
+
+def count_posts(query : dict) -> int:
+    # On the mongomock-collection: not counted as a query of the workers
+    return get_mongo_client()[DATABASE_NAME].post_data.collection.count_documents(query)
+
+
+# *** Workers: init() is not measured, run() processes all open posts and returns how many ***
+def init_lang_detector():
+    from posts_analyzer import lang_detector
+    lang_detector.init()
+
+    def run() -> int:
+        lang_detector.run_pipeline(exit_when_idle=True)
+        return count_posts({"lang" : {"$ne" : None}})
+    return run
+
+def init_categorizer():
+    from posts_analyzer import async_categorizer
+    asyncio.get_event_loop().run_until_complete(async_categorizer.init())
+
+    async def categorize_all() -> None:
+        while (await async_categorizer.categorize_posts())[1] > 0:
+            pass
+
+    def run() -> int:
+        asyncio.get_event_loop().run_until_complete(categorize_all())
+        return count_posts({"categories" : {"$ne" : None}})
+    return run
+
+def init_vectorizer():
+    from posts_analyzer import post_vectorizer
+
+    async def vectorize_all() -> None:
+        vectorized = -1
+        while vectorized != count_posts({"lang_proceeded" : True}): # Stops when a batch did not change anything
+            vectorized = count_posts({"lang_proceeded" : True})
+            await post_vectorizer.manage_native_posts()
+            await post_vectorizer.manage_stock_posts()
+
+    def run() -> int:
+        asyncio.get_event_loop().run_until_complete(vectorize_all())
+        return count_posts({"lang_proceeded" : True})
+    return run
+
+
+def run_worker(name : str) -> dict:
+    try:
+        start_time = time.time()
+        run = globals()[f"init_{name}"]()
+        init_time = time.time() - start_time
+    except (ImportError, OSError, ValueError, LookupError) as ex: # Model or package not available
+        print(f"[INFO] {name}: skipped ({ex})")
+        return {"skipped" : str(ex)}
+
+    BackendStats.reset()
+    start_time = time.time()
+    posts = run()
+    elapsed_time = time.time() - start_time
+
+    result = {
+        "posts" : posts,
+        "init_s" : round(init_time, 3),
+        "seconds" : round(elapsed_time, 3),
+        "posts_per_s" : round(posts / elapsed_time, 2) if elapsed_time > 0 else None,
+        **BackendStats.snapshot()
+    }
+    result["queries_per_post"] = round(result["queries_total"] / posts, 3) if posts > 0 else None
+    print(f"[INFO] {name}: {posts} posts | {result['posts_per_s']} posts/s | {result['queries_total']} queries | {result['bytes_written']} bytes written")
+    return result
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of the workers with in-memory backends")
+    parser.add_argument("-n", "--size", help="synthetic posts", type=int, default=500)
+    parser.add_argument("-w", "--workers", help="workers to run (default: all)", nargs="*", choices=WORKERS, default=WORKERS)
+    parser.add_argument("-o", "--output", help="result file (default: only print)")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.size)
+    seed(corpus)
+
+    results = {"created" : datetime.utcnow().isoformat(), "posts" : args.size, "workers" : {}}
+    for name in WORKERS:
+        if name in args.workers:
+            results["workers"][name] = run_worker(name)
+
+        if name == "lang_detector" and "posts" not in results["workers"].get(name, {}):
+            set_langs(corpus) # The next workers need langs
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ parser.add_argument("-c", "--categorizer", help="start Posts Categorizer", actio
 parser.add_argument("-b", "--bot", help="start Bot", action="store_true")
 parser.add_argument("-pv", "--posts_vectorizer", help="start Posts Vectorizer", action="store_true")
 parser.add_argument("-sca", "--stock_comment_analyzer", help="start StockImage-Comment Analyzer", action="store_true")
+parser.add_argument("-psi", "--posts_search_index", help="start Posts Search Index (builds, refreshes and saves agents.PostsCategory)", action="store_true")
 parser.add_argument("-tm", "--test_modules", help="Test dependencies by importing all modules", action="store_true")
 
 
@@ -20,6 +21,7 @@ parser.add_argument("-tm", "--test_modules", help="Test dependencies by importin
 #   (categorizer.start, "Posts Categorizer Process", True)
 #   (post_vectorizer.start, "Posts Vectorizer Process", True)
 #   (bot.start, "Bot Process", True)
+#   (PostsCategory.start, "Posts Search Index Process", True)
 
 
 
@@ -36,6 +38,7 @@ def main():
       from posts_analyzer import lang_detector
       from posts_analyzer import async_categorizer
       from bot import ac_bot
+      from agents import PostsCategory
       print("All modules were imported successfully.")
    if args.langdetector or args.all:
       from posts_analyzer import lang_detector
@@ -49,6 +52,9 @@ def main():
    if args.bot or args.all:
       from bot import ac_bot
       process_templates.append((ac_bot.start, "Bot Process", True))
+   if args.posts_search_index or args.all:
+      from agents import PostsCategory
+      process_templates.append((PostsCategory.start, "Posts Search Index Process", True))
    if args.stock_comment_analyzer or args.all:
       from posts_analyzer import stockcomments_analyzer
       process_templates.append((stockcomments_analyzer.start, "StockImage-Comment Analyzer Process", True))
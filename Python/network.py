@@ -15,6 +15,16 @@ def get_all_vocabs_as_sentence()->list:
     '''Return a list of all vocabs inside word2vec for search'''
     return [str(w) for w in statics.FASTTEXT_MODEL.wv.vocab]#statics.WORD2VEC_MODEL.wv.vocab]
 
+def mask_padded_windows(x : T.Tensor, lengths : T.Tensor, window_size : int) -> T.Tensor:
+    '''
+    Sets conv-outputs of windows which reach into the padding to -inf, so max-pooling
+    over a padded batch gives the same result as running every sequence on its own.
+    x.shape = [Batch-Dim, Kernels, Positions] | lengths.shape = [Batch-Dim]
+    '''
+    positions = T.arange(x.size(2), device=x.device)
+    padded = positions.unsqueeze(0) > (lengths - window_size).unsqueeze(1) # [Batch-Dim, Positions]
+    return x.masked_fill(padded.unsqueeze(1), float("-inf"))
+
 
 class TextCNN(nn.Module):
     def __init__(self):
@@ -29,12 +39,15 @@ class TextCNN(nn.Module):
         self.fc3 = nn.Linear(KERNEL_NUM, len(CATEGORIES))
         self.relu = nn.ReLU()
 
-    def forward(self, x): 
+    def forward(self, x, lengths = None): 
         # Convs Layer
+        # lengths (optional): real sequence lengths when x is a zero-padded batch
         xs = []
-        for conv in self.convs:
+        for conv, window_size in zip(self.convs, WINDOW_SIZES):
             x2 = T.tanh(conv(x.unsqueeze(1)))
             x2 = T.squeeze(x2, -1)
+            if lengths is not None:
+                x2 = mask_padded_windows(x2, lengths, window_size)
             x2 = F.max_pool1d(x2, x2.size(2))
             x2 = self.dropout(x2)
             xs.append(x2)
@@ -69,6 +82,7 @@ class LangDetector():
     def __init__(self, load_model = True) -> None:
         '''Loads the lang-model'''
         self.model = None
+        self.labels = {} # {"__label__en" : "en"}
 
         if load_model:
             # Load
@@ -80,18 +94,31 @@ class LangDetector():
         Predict the language of a given text and return label of of predicted language.
         Returns in this way: [{"lang" : "en", "x" : 0.99}, ...]
         '''
+        return self.predict_langs([text])[0]
+
+    def predict_langs(self, texts : list) -> list:
+        '''
+        Predict the languages of many texts with one call of the model.
+        Returns for every text: [[{"lang" : "en", "x" : 0.99}, ...], ...]
+        '''
+        if len(texts) == 0:
+            return []
 
-        # predict returns something like(("label_1", "label_2"), array(0.4, 0.5))
-        labels, scores = self.model.predict(text, k=3)
+        # predict returns something like([("label_1", "label_2"), ...], [array(0.4, 0.5), ...])
+        all_labels, all_scores = self.model.predict(texts, k=3)
 
         # Get only langs that could be (score above 0.2)
         predictions = []
-        for label, score in zip(labels, scores):
-            if score > 0.2:
-                predictions.append((label.replace("__label__", ""), score))
+        for labels, scores in zip(all_labels, all_scores):
+            langs = []
+            for label, score in zip(labels, scores):
+                if score > 0.2:
+                    if label not in self.labels:
+                        self.labels[label] = label.replace("__label__", "")
+                    langs.append({"lang" : self.labels[label], "x" : score})
+            predictions.append(langs)
 
-
-        return [{"lang" : label, "x" : score} for label, score in predictions]
+        return predictions
 
 class FakeNewsCNN(nn.Module):
     def __init__(self):
@@ -106,12 +133,15 @@ class FakeNewsCNN(nn.Module):
         self.fc3 = nn.Linear(int(KERNEL_NUM / 2), 2)
         self.relu = nn.ReLU()
 
-    def forward(self, x): 
+    def forward(self, x, lengths = None): 
         # Convs Layer
+        # lengths (optional): real sequence lengths when x is a zero-padded batch
         xs = []
-        for conv in self.convs:
+        for conv, window_size in zip(self.convs, WINDOW_SIZES):
             x2 = T.tanh(conv(x.unsqueeze(1)))
             x2 = T.squeeze(x2, -1)
+            if lengths is not None:
+                x2 = mask_padded_windows(x2, lengths, window_size)
             x2 = F.max_pool1d(x2, x2.size(2))
             x2 = self.dropout(x2)
             xs.append(x2)
@@ -143,4 +173,97 @@ class FakeNewsCNN(nn.Module):
 
 
 
-        
\ No newline at end of file
+        
+
+class CategorizerCNN(nn.Module):
+    '''
+    Inference engine for TextCNN and FakeNewsCNN: runs the conv-stack once per window size and
+    feeds the pooled features into both heads. When both models have identical conv weights, the trunk
+    is shared. Else both conv-stacks are fused into one conv with 2 * KERNEL_NUM channels per window size.
+    '''
+    def __init__(self, shared_trunk : bool = False):
+        super(CategorizerCNN, self).__init__()
+        self.shared_trunk = shared_trunk
+
+        channels = KERNEL_NUM if shared_trunk else KERNEL_NUM * 2
+        self.convs = nn.ModuleList([
+                            nn.Conv2d(1, channels, (i, EMBEDDING_DIM)) for i in WINDOW_SIZES ])
+        self.dropout = nn.Dropout(0.25)
+
+        self.text_fcs = nn.ModuleList([
+                            nn.Linear(KERNEL_NUM * len(WINDOW_SIZES), KERNEL_NUM), 
+                            nn.Linear(KERNEL_NUM, KERNEL_NUM), 
+                            nn.Linear(KERNEL_NUM, len(CATEGORIES)) ])
+        self.fakenews_fcs = nn.ModuleList([
+                            nn.Linear(KERNEL_NUM * len(WINDOW_SIZES), KERNEL_NUM), 
+                            nn.Linear(KERNEL_NUM, int(KERNEL_NUM / 2)), 
+                            nn.Linear(int(KERNEL_NUM / 2), 2) ])
+
+    def head(self, fcs : nn.ModuleList, x): 
+        # FC1 and FC2 
+        x = self.dropout(x)
+        x = x.reshape(x.size(0), -1)
+        x = F.relu(fcs[0](x))
+        x = F.relu(fcs[1](x))
+
+        # FC3
+        return fcs[2](x)
+
+    def forward(self, x, lengths = None) -> tuple: 
+        '''Returns (categories, fakenews) like TextCNN and FakeNewsCNN would do'''
+        # Convs Layer (once for both models)
+        xs = []
+        for conv, window_size in zip(self.convs, WINDOW_SIZES):
+            x2 = T.tanh(conv(x.unsqueeze(1)))
+            x2 = T.squeeze(x2, -1)
+            if lengths is not None:
+                x2 = mask_padded_windows(x2, lengths, window_size)
+            x2 = F.max_pool1d(x2, x2.size(2))
+            xs.append(x2)
+        x = T.cat(xs, 2) # [Batch-Dim, Kernels, Windows]
+
+        # Split features for both heads
+        if self.shared_trunk:
+            text_x, fakenews_x = x, x
+        else:
+            text_x, fakenews_x = x[:, :KERNEL_NUM], x[:, KERNEL_NUM:]
+
+        categories = T.sigmoid(self.head(self.text_fcs, text_x))
+        fakenews = F.softmax(self.head(self.fakenews_fcs, fakenews_x), dim = 1)
+        return (categories, fakenews)
+
+    @staticmethod
+    def from_models(text_cnn : TextCNN, fakenews_cnn : FakeNewsCNN) -> "CategorizerCNN":
+        '''Creates the engine from the weights of both (trained) models'''
+        shared_trunk = all(
+            T.equal(text_conv.weight, fake_conv.weight) and T.equal(text_conv.bias, fake_conv.bias) 
+            for text_conv, fake_conv in zip(text_cnn.convs, fakenews_cnn.convs))
+        model = CategorizerCNN(shared_trunk=shared_trunk)
+
+        with T.no_grad():
+            for conv, text_conv, fake_conv in zip(model.convs, text_cnn.convs, fakenews_cnn.convs):
+                if shared_trunk:
+                    conv.weight.copy_(text_conv.weight)
+                    conv.bias.copy_(text_conv.bias)
+                else:
+                    conv.weight.copy_(T.cat([text_conv.weight, fake_conv.weight], 0))
+                    conv.bias.copy_(T.cat([text_conv.bias, fake_conv.bias], 0))
+
+            for fcs, source in ((model.text_fcs, text_cnn), (model.fakenews_fcs, fakenews_cnn)):
+                for fc, source_fc in zip(fcs, (source.fc1, source.fc2, source.fc3)):
+                    fc.load_state_dict(source_fc.state_dict())
+
+        model.train(text_cnn.training)
+        return model
+
+    @staticmethod
+    def load_model() -> tuple:
+        '''
+        Loads TextCNN and FakeNewsCNN from Disc and creates the engine of them. All three are in eval-mode (no dropout) for inference
+        Returns: tuple ( model : CategorizerCNN, text_cnn : TextCNN, fakenews_cnn : FakeNewsCNN, from_disc : bool )
+        '''
+        text_cnn, text_from_disc = TextCNN.load_model()
+        fakenews_cnn, fakenews_from_disc = FakeNewsCNN.load_model()
+        text_cnn.eval(), fakenews_cnn.eval()
+        model = CategorizerCNN.from_models(text_cnn, fakenews_cnn)
+        return (model, text_cnn, fakenews_cnn, text_from_disc and fakenews_from_disc)
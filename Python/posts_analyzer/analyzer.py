@@ -16,21 +16,26 @@ class statics:
     TEXT_CNN = None
     LMZT = None
 
-async def detect_lang(post : dict) -> None:
-    '''Detect a Language and insert it into DB'''
-    text = ""
-    if "title" in post:
-        text += post["title"] + ". "
-    if "body" in post:
-        text += post["body"] + ". "
-
-    if len(text.split(' ')) > 2:
-        text = helper.pre_process_text(text, lmtz=statics.LMZT)
-        lang = statics.LANG_DETECTOR.predict_lang(text)
-    else:
-        lang = []
-
-    await MongoDBAsync.post_table.update_many({"post_id" : post["post_id"]}, {"$set" : {"lang" : lang}})
+async def detect_langs(posts : list) -> None:
+    '''Detect the Languages of some posts (one call of the model) and insert them into DB'''
+    texts, langs = [], [[] for _ in posts]
+    for post in posts:
+        text = ""
+        if "title" in post:
+            text += post["title"] + ". "
+        if "body" in post:
+            text += post["body"] + ". "
+        texts.append(text)
+
+    indexes = [index for index, text in enumerate(texts) if len(text.split(' ')) > 2]
+    predictions = statics.LANG_DETECTOR.predict_langs([helper.pre_process_text(texts[index], lmtz=statics.LMZT) for index in indexes])
+    for index, lang in zip(indexes, predictions):
+        langs[index] = lang
+
+    await asyncio.gather(*[
+        MongoDBAsync.post_table.update_many({"post_id" : post["post_id"]}, {"$set" : {"lang" : lang}})
+        for post, lang in zip(posts, langs)
+    ])
 
 async def categorize_post(post : dict) -> None:
     '''Categorize a post based on TextCNN and update post in DB'''
@@ -83,20 +88,22 @@ async def run():
 
     while 1:
         # 1. Analyze Language
-        tasks = []
+        tasks, lang_posts = [], []
         async for post in MongoDBAsync.post_table.find({"lang" : None}):
-            tasks.append(detect_lang(post))
+            lang_posts.append(post)
 
             # Prevent Overflow
-            if len(tasks) > 50:
+            if len(lang_posts) > 50:
                 break
+        if len(lang_posts) > 0:
+            tasks.append(detect_langs(lang_posts))
 
         # 2. Anaylze Categories
         async for post in MongoDBAsync.post_table.find({"categories_doc" : None}):
             tasks.append(categorize_post(post))
 
             # Prevent Overflow
-            if len(tasks) > 100:
+            if len(tasks) + len(lang_posts) > 100:
                 break
             
         if len(tasks) > 0:
@@ -11,31 +11,31 @@ from pymongo import UpdateMany, UpdateOne
 import nltk
 from nltk.corpus import stopwords
 
-from network import TextCNN, FakeNewsCNN
+from network import TextCNN, FakeNewsCNN, CategorizerCNN
 from config import *
 from helper import helper, Lemmatizer
 from database import MongoDBAsync
+from word_vectors import get_word_vector_source
 
 class statics:
     TEXT_CNN : TextCNN = None
     FAKENEWS_CNN : FakeNewsCNN = None
+    CATEGORIZER_CNN : CategorizerCNN = None
     LMZT : Lemmatizer = None
     Unknown_Tokens : list = []
     Bulk_PostData_Updates : list = []
     Bulk_PostText_Updates : list = []
     Os_PostData_Update : list = []
+    WORD_VECTORS = None # WordVectorStore or WordVectorCache
 
 
 os_client = get_opensearch_client()
         
 # Inits  
 def load_models() -> None:
-    '''Load TextCnn and lmtz'''
-    statics.TEXT_CNN, loaded = TextCNN.load_model()
-    print(f"Loaded TextCNN from Disk? - {loaded}")
-
-    statics.FAKENEWS_CNN, loaded = FakeNewsCNN.load_model()
-    print(f"Loaded FakeNewsCNN from Disk? - {loaded}")
+    '''Load TextCnn, FakeNewsCNN (as one CategorizerCNN) and lmtz'''
+    statics.CATEGORIZER_CNN, statics.TEXT_CNN, statics.FAKENEWS_CNN, loaded = CategorizerCNN.load_model()
+    print(f"Loaded TextCNN and FakeNewsCNN from Disk? - {loaded} (CategorizerCNN shared trunk: {statics.CATEGORIZER_CNN.shared_trunk})")
 
     statics.LMZT = Lemmatizer()
     
@@ -51,18 +51,11 @@ def remove_stopwords(tok_body : list) -> str:
     return " ".join([word for word in tok_body if word not in stopwords.words("english")])
 
 async def get_word_vectors(tok_body : list) -> dict:
-    # Retrieve Word-Vectors from MongoDB and decode them to np.array
-    server_vectors = {} 
-    doc_cursor = MongoDBAsync.mongo_client["fasttext"].en.find({"_id" : {"$in" : tok_body}})
-    async for document in doc_cursor:
-        # Decode Binary to np.array and add to dict
-        vector = np.frombuffer(document["v"], dtype=np.float32)
-        server_vectors[document["_id"]] = vector
-
-    return server_vectors
-
-async def process_one_post(post : dict) -> None:
-    # Prepare, Tokenize and Vectorize Text
+    # Retrieve Word-Vectors from the local store or the cache (or MongoDB) as np.array
+    return await statics.WORD_VECTORS.get_vectors("en", tok_body)
+
+async def prepare_text(post : dict) -> str:
+    '''Prepare the text of one post for tokenizing'''
     text = ""
     if "title" in post:
         text += post["title"] + ". "
@@ -70,11 +63,18 @@ async def process_one_post(post : dict) -> None:
         text += post["body"] + ". "
     if "tags" in post:
         text += post["tags"]
-    text = helper.pre_process_text(text, lmtz=statics.LMZT)
-    tok_text = helper.tokenize_text(text)
+    text = helper.pre_process_text(text, lemmatize=False)
+    return await statics.LMZT.lemmatize_async(text)
+
+async def process_one_post(post : dict) -> tuple:
+    '''Prepare, tokenize and vectorize one post. Returns (post_id, vectors, known_tokens, unknown_tokens)'''
+    tok_text = helper.tokenize_text(await prepare_text(post))
+    return await vectorize_tokens(post["_id"], tok_text)
+
+async def vectorize_tokens(post_id : int, tok_text : list) -> tuple:
+    '''Vectorize the tokens of one post. Returns (post_id, vectors, known_tokens, unknown_tokens)'''
     vector_map = await get_word_vectors(tok_text)
 
-    doc_vector = []
     vectors = []
 
     # Transform vector map to an ordered list word by word + unknown tokens
@@ -83,127 +83,167 @@ async def process_one_post(post : dict) -> None:
         if word in vector_map:
             # Known Token
             vectors.append(vector_map[word])
-            doc_vector.append(vector_map[word])
             known_tokens += 1
         else:
             # Unknown Token
             vectors += statics.Unknown_Tokens
             unknown_tokens += 1
-    
-    # Calc doc_vector by summing all known tokens and calc average
-    doc_vector = (np.sum(doc_vector, axis=0) / known_tokens).tolist()
- 
-    if len(vectors) < MIN_KNOWN_WORDS:
-        # Not enough words
-        categories = False
-        fakenews_prob = False
-    else:
-        # Calculate categories
-        _input = T.Tensor([vectors]) # _input.shape = [Batch-Dim, Word, Vectors]
-        _output = statics.TEXT_CNN(_input) # _output.shape = [Batch-Dim, Categories] 
-        categories = _output.data[0].tolist()
-            
 
-        # Calculate fakenews_prob
-        _input = T.Tensor([vectors]) # _input.shape = [Batch-Dim, Word, Vectors]
-        _output = statics.FAKENEWS_CNN(_input) 
-        fakenews_prob = _output.data[0].tolist()[0] # fakenews = [1, 0] | realnews = [0, 1]
+    return (post_id, vectors, known_tokens, unknown_tokens)
+
+def bucket_by_length(items : list, max_ratio : float = 1.5) -> list:
+    '''
+    Sorts items (post_id, vectors, ...) by their sequence length and groups them into buckets.
+    A bucket is closed when the next sequence is longer than max_ratio * the shortest in it,
+    so padding stays small
+    '''
+    buckets = []
+    for item in sorted(items, key=lambda x: len(x[1])):
+        if len(buckets) == 0 or len(item[1]) > len(buckets[-1][0][1]) * max_ratio:
+            buckets.append([])
+        buckets[-1].append(item)
+
+    return buckets
+
+def categorize_batch(prepared : list) -> dict:
+    '''
+    Run CategorizerCNN (TextCNN and FakeNewsCNN) once per length-bucket over all prepared posts.
+    Returns {post_id : (categories, fakenews_prob)}
+    '''
+    results = {}
+    items = []
+    for item in prepared:
+        if len(item[1]) < MIN_KNOWN_WORDS:
+            # Not enough words
+            results[item[0]] = (False, False)
+        else:
+            items.append(item)
+
+    with T.inference_mode():
+        for bucket in bucket_by_length(items):
+            # Zero-pad all sequences into one array. _input.shape = [Batch-Dim, Word, Vectors]
+            lengths = [len(vectors) for _, vectors, _, _ in bucket]
+            _input = np.zeros((len(bucket), max(lengths), len(statics.Unknown_Tokens[0])), dtype=np.float32)
+            for index, (_, vectors, _, _) in enumerate(bucket):
+                _input[index, :lengths[index]] = np.stack(vectors)
+            _input, lengths = T.from_numpy(_input), T.tensor(lengths)
 
+            # Calculate categories and fakenews_prob
+            categories, fakenews = statics.CATEGORIZER_CNN(_input, lengths=lengths)
+            categories = categories.tolist() # [Batch-Dim, Categories]
+            fakenews = fakenews.tolist() # fakenews = [1, 0] | realnews = [0, 1]
 
+            for index, (post_id, _, _, _) in enumerate(bucket):
+                results[post_id] = (categories[index], fakenews[index][0])
+
+    return results
+
+def add_post_updates(post_id : int, categories, fakenews_prob, known_tokens : int, unknown_tokens : int) -> None:
     # post_data Update for Mongo
     statics.Bulk_PostData_Updates.append(
-        UpdateOne({"_id" : post["_id"]}, {"$set" : {
-            "categories" : categories, 
-            #"doc_vector" : doc_vector, 
-            "fakenews_prob" : fakenews_prob,
-            "tokens" : { "known" : known_tokens, "unknown" : unknown_tokens }
-            }
+        UpdateOne({"_id" : post_id}, {
+            "$set" : {
+                "categories" : categories, 
+                "fakenews_prob" : fakenews_prob,
+                "tokens" : { "known" : known_tokens, "unknown" : unknown_tokens }
+            },
+            "$currentDate" : {"categories_timestamp" : True} # for the delta of agents.PostsCategory (clock of the DB, when written)
         })
     )
 
     # post_text Update for OpenSearch
     statics.Os_PostData_Update += [
-        {"update" : {"_index" : "hive-post-data", "_id" : post["_id"]}}, # Metadata
+        {"update" : {"_index" : "hive-post-data", "_id" : post_id}}, # Metadata
         {"doc" : {"categories" : categories}}
     ]
 
 
-async def run(BATCH_SIZE : int = 25) -> None:
-    # Init
+async def init() -> None:
     nltk.download("stopwords")
     load_models()
     MongoDBAsync.init_global(post_table=True)
+    statics.WORD_VECTORS = get_word_vector_source(MongoDBAsync.mongo_client["fasttext"])
 
     await get_unknown_tokens()  
     helper.init()
-    
 
+async def categorize_posts(BATCH_SIZE : int = 25) -> tuple:
+    '''Categorizes a batch of (randomly) open posts. Returns (open posts, categorized posts)'''
     AGGREGATION_PIPELINE = [
         {"$match" : {"categories" : None, "lang.lang" : "en"}},
         {"$sample" : {"size" : BATCH_SIZE}}
     ]
 
+    # Get (randomly) open posts
+    open_posts_ids = []
+    async for current_post in MongoDBAsync.post_data.aggregate(AGGREGATION_PIPELINE):   
+        if len(open_posts_ids) >= BATCH_SIZE:
+            break
+        open_posts_ids.append(current_post["_id"])     
+
+    # Got something to do ==> Get text-data and start processing
+    posts = [current_post async for current_post in MongoDBAsync.post_text.find({"_id" : {"$in" : open_posts_ids}})]
+           
+    # Prepare and tokenize all texts (batched), vectorize them and then run the models batched
+    if len(posts) > 0:
+        texts = await asyncio.gather(*[prepare_text(post) for post in posts])
+        tok_texts = helper.tokenize_texts(texts)
+        prepared = await asyncio.gather(*[vectorize_tokens(post["_id"], tok_text) for post, tok_text in zip(posts, tok_texts)])
+        results = categorize_batch(prepared)
+        for post_id, _, known_tokens, unknown_tokens in prepared:
+            categories, fakenews_prob = results[post_id]
+            add_post_updates(post_id, categories, fakenews_prob, known_tokens, unknown_tokens)
+
+    # Update Bulks for post_data       
+    async def doPostDataUpdate():
+        if len(statics.Bulk_PostData_Updates) == 0:
+            return
+
+        try:
+            await MongoDBAsync.post_data.bulk_write(statics.Bulk_PostData_Updates, ordered=False)
+        except BulkWriteError as ex:
+            print("Error on BulkWrite for post_data:")
+            print(ex)
+        statics.Bulk_PostData_Updates = []                    
+
+    # Update Bulks for post_text        
+    async def doPostTextUpdate():
+        if len(statics.Bulk_PostText_Updates) == 0:
+            return
+
+        try:
+            await MongoDBAsync.post_text.bulk_write(statics.Bulk_PostText_Updates, ordered=False)
+        except BulkWriteError as ex:
+            print("Error on BulkWrite for post_text:")
+            print(ex)
+        statics.Bulk_PostText_Updates = []
+
+    async def doOpenSearchUpdate():
+        if len(statics.Os_PostData_Update) == 0:
+            return
+
+        os_client.bulk(body=statics.Os_PostData_Update, index="hive-post-data")
+        statics.Os_PostData_Update = []
+
+    # Do all updates (as tasks: asyncio.wait does not take coroutines since Python 3.11)
+    await asyncio.wait([asyncio.ensure_future(update()) for update in (doPostDataUpdate, doPostTextUpdate, doOpenSearchUpdate)])
+    return (len(open_posts_ids), len(posts))
+
+async def run(BATCH_SIZE : int = 25) -> None:
+    await init()
+
     while 1:
-        tasks = []
         start_time = time.time()
-
-        # Get (randomly) open posts
-        open_posts_ids = []
-        async for current_post in MongoDBAsync.post_data.aggregate(AGGREGATION_PIPELINE):   
-            if len(open_posts_ids) >= BATCH_SIZE:
-                break
-            open_posts_ids.append(current_post["_id"])     
-
-        # Got something to do ==> Get text-data and start processing
-        async for current_post in MongoDBAsync.post_text.find({"_id" : {"$in" : open_posts_ids}}):
-            tasks.append(process_one_post(current_post))
-               
-        # Wait for everything to has finished
-        if len(tasks) > 0:
-            await asyncio.wait(tasks)
-
-        # Update Bulks for post_data       
-        async def doPostDataUpdate():
-            if len(statics.Bulk_PostData_Updates) == 0:
-                return
-
-            try:
-                await MongoDBAsync.post_data.bulk_write(statics.Bulk_PostData_Updates, ordered=False)
-            except BulkWriteError as ex:
-                print("Error on BulkWrite for post_data:")
-                print(ex)
-            statics.Bulk_PostData_Updates = []                    
-
-        # Update Bulks for post_text        
-        async def doPostTextUpdate():
-            if len(statics.Bulk_PostText_Updates) == 0:
-                return
-
-            try:
-                await MongoDBAsync.post_text.bulk_write(statics.Bulk_PostText_Updates, ordered=False)
-            except BulkWriteError as ex:
-                print("Error on BulkWrite for post_text:")
-                print(ex)
-            statics.Bulk_PostText_Updates = []
-
-        async def doOpenSearchUpdate():
-            if len(statics.Os_PostData_Update) == 0:
-                return
-
-            os_client.bulk(body=statics.Os_PostData_Update, index="hive-post-data")
-            statics.Os_PostData_Update = []
-
-        # Do all updates
-        await asyncio.wait([doPostDataUpdate(), doPostTextUpdate(), doOpenSearchUpdate()])
+        open_posts, categorized_posts = await categorize_posts(BATCH_SIZE)
             
         # Send heartbeat
         elapsed_time = (time.time() - start_time) * 1000
-        if len(tasks) > 0:
-            print(f"[INFO] Categorized {len(tasks)} posts in {elapsed_time}ms")     
+        if categorized_posts > 0:
+            print(f"[INFO] Categorized {categorized_posts} posts in {elapsed_time}ms. Word-Vector-Cache: {statics.WORD_VECTORS.stats()}")     
         do_heartbeat("CATEGORIZER", params={"msg" : "OK", "ping" : elapsed_time})
 
         # No open_posts? ==> wait
-        if len(open_posts_ids) == 0:
+        if open_posts == 0:
             await asyncio.sleep(10)
             
 
@@ -2,6 +2,10 @@ import time
 import sys, os
 sys.path.append(os.getcwd() + "/.")
 
+from queue import Queue, Empty, Full
+from threading import Thread
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 from pymongo import UpdateOne
 
 from database import MongoDB
@@ -14,8 +18,15 @@ lang_detector, lmtz = (LangDetector(load_model=True), Lemmatizer())
 
 os_client = get_opensearch_client()
 
-def detect_lang(post : dict, lang_detector : LangDetector, lmtz : Lemmatizer) -> list:
-    '''Detect langs and return it'''
+PAGE_SIZE = 100
+QUEUE_SIZE = 4 # pages waiting in front of a stage (backpressure)
+OPEN_LANG_QUERY = {"$or" : [{"lang" : None}, {"lang" : {"$exists" : False}}]}
+TEXT_FIELDS = ("text", "title", "body")
+
+class statics:
+    ERROR : Exception = None # set by a failed stage, stops the pipeline
+
+def get_text(post : dict) -> str:
     text = ""
     if "text" in post:
         text += post["text"] + ". "
@@ -23,91 +34,203 @@ def detect_lang(post : dict, lang_detector : LangDetector, lmtz : Lemmatizer) ->
         text += post["title"] + ". "
     if "body" in post:
         text += post["body"] + ". "
+    return text
 
-    if len(text.split(' ')) > 2:
-        text = helper.pre_process_text(text, lmtz=lmtz)
-        lang = lang_detector.predict_lang(text)
-    else:
-        lang = []
-    return lang
-
-def get_for_nativeposts() -> int:
-    # Get Ids to work on
-    posts = [p for p in MongoDB.post_data.find({"$or" : [{"lang" : None}, {"lang" : {"$exists" : False}}]}, projection={"_id" :1}).limit(100)]
-    
-    # Get Text and Lang for each _id
+def detect_lang(post : dict, lang_detector : LangDetector, lmtz : Lemmatizer) -> list:
+    '''Detect langs and return it'''
+    return detect_langs([post], lang_detector, lmtz)[0]
+
+def detect_langs(posts : list, lang_detector : LangDetector = lang_detector, lmtz : Lemmatizer = lmtz) -> list:
+    '''Detect langs of some posts with one call of the model (runs inside the process pool)'''
+    langs = [[] for _ in posts]
+    indexes, texts = [], []
+    for index, post in enumerate(posts):
+        text = get_text(post)
+        if len(text.split(' ')) > 2:
+            indexes.append(index)
+            texts.append(helper.pre_process_text(text, lmtz=lmtz))
+
+    for index, lang in zip(indexes, lang_detector.predict_langs(texts)):
+        langs[index] = lang
+    return langs
+
+
+#   *** Sources ***
+#   read_*(last_id) -> (last_id, docs) : next page after last_id (sorted by _id)
+#   write_*(docs, langs) : write detected langs
+def page_query(last_id) -> dict:
+    if last_id is None:
+        return OPEN_LANG_QUERY
+    return {**OPEN_LANG_QUERY, "_id" : {"$gt" : last_id}}
+
+def read_nativeposts(last_id) -> tuple:
+    # Get Ids to work on, then the Text for each _id
+    ids = [p["_id"] for p in MongoDB.post_data.find(page_query(last_id), projection={"_id" : 1}).sort("_id", 1).limit(PAGE_SIZE)]
+    if len(ids) == 0:
+        return (last_id, [])
+
+    docs = [doc for doc in MongoDB.post_text.find({"_id" : {"$in" : ids}}, projection=TEXT_FIELDS)]
+    return (ids[-1], docs)
+
+def write_nativeposts(docs : list, langs : list) -> None:
     mongo_bulk_updates = []
     opensearch_bulk_updates = []
-    for current_post in MongoDB.post_text.find({"_id" : {"$in" : [p["_id"] for p in posts]}}):
-        lang = detect_lang(current_post, lang_detector, lmtz)
+    for current_post, lang in zip(docs, langs):
         mongo_bulk_updates.append(UpdateOne({"_id" : current_post["_id"]}, {"$set" : {"lang" : lang}}))
 
         opensearch_bulk_updates.append({ "update" : { "_index": "hive-post-data", "_id" : current_post["_id"] }})
         opensearch_bulk_updates.append({ "doc" : { "language" : lang }})
 
+    # Do changes (Mongo and OpenSearch concurrently)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [
+            executor.submit(MongoDB.post_data.bulk_write, mongo_bulk_updates, ordered=False),
+            executor.submit(os_client.bulk, body=opensearch_bulk_updates, index="hive-post-data")
+        ]
+        for future in futures:
+            future.result()
+
+def read_stockcomments(last_id) -> tuple:
+    docs = [doc for doc in MongoDB.mongo_client["images"].post_replies.find(page_query(last_id), projection=TEXT_FIELDS).sort("_id", 1).limit(PAGE_SIZE)]
+    return (docs[-1]["_id"] if docs else last_id, docs)
+
+def write_stockcomments(docs : list, langs : list) -> None:
+    bulk_updates = [UpdateOne({"_id" : comment["_id"]}, {"$set" : {"lang" : lang}}) for comment, lang in zip(docs, langs)]
+    MongoDB.mongo_client["images"].post_replies.bulk_write(bulk_updates, ordered=False)
+
+def read_replies(last_id) -> tuple:
+    docs = [doc for doc in MongoDB.post_replies.find(page_query(last_id), projection=TEXT_FIELDS).sort("_id", 1).limit(PAGE_SIZE)]
+    return (docs[-1]["_id"] if docs else last_id, docs)
+
+def write_replies(docs : list, langs : list) -> None:
+    bulk_updates = [UpdateOne({"_id" : current_post["_id"]}, {"$set" : {"lang" : lang}}) for current_post, lang in zip(docs, langs)]
+    MongoDB.post_replies.bulk_write(bulk_updates, ordered=False)
+
+SOURCES = {
+    "nativeposts" : (read_nativeposts, write_nativeposts),
+    "stockcomments" : (read_stockcomments, write_stockcomments),
+    "replies" : (read_replies, write_replies)
+}
+
+
+#   *** Pipeline Stages ***
+def put(queue : Queue, item) -> None:
+    '''Blocking put, which aborts when another stage failed'''
+    while 1:
+        if statics.ERROR:
+            raise statics.ERROR
+        try:
+            return queue.put(item, timeout=1)
+        except Full:
+            continue
+
+def get(queue : Queue):
+    '''Blocking get, which aborts when another stage failed'''
+    while 1:
+        if statics.ERROR:
+            raise statics.ERROR
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            continue
+
+def drain(*queues) -> None:
+    '''Wait until all queues are processed'''
+    while any(queue.unfinished_tasks > 0 for queue in queues):
+        if statics.ERROR:
+            raise statics.ERROR
+        time.sleep(0.1)
+
+def run_stage(target, *args) -> Thread:
+    '''Runs a stage in a daemon-thread and stops the pipeline when it fails'''
+    def stage():
+        try:
+            target(*args)
+        except Exception as ex:
+            statics.ERROR = ex
+    
+    thread = Thread(target=stage, daemon=True)
+    thread.start()
+    return thread
 
-    # Do changes
-    if len(mongo_bulk_updates) > 0:
-        MongoDB.post_data.bulk_write(mongo_bulk_updates, ordered=False)
-    if len(opensearch_bulk_updates) > 0:
-        os_client.bulk(body=opensearch_bulk_updates, index="hive-post-data")
-
-    return len(mongo_bulk_updates)
-
-def get_for_stockcomments():
-    bulk_updates = []
-
-    # Go through an amount of unprocessed stockcomments
-    for comment in MongoDB.mongo_client["images"].post_replies.find({"$or" : [{"lang" : None}, {"lang" : {"$exists" : False}}]}).limit(100):
-        lang = detect_lang(comment, lang_detector, lmtz)
-        bulk_updates.append(UpdateOne({"_id" : comment["_id"]}, {"$set" : {"lang" : lang}}))
-
-    # Do changes
-    if len(bulk_updates) > 0:
-        MongoDB.mongo_client["images"].post_replies.bulk_write(bulk_updates, ordered=False)
-
-    return len(bulk_updates)
-
-def get_for_replies() -> int:   
-    # Get Text
-    bulk_updates = []
-    for current_post in MongoDB.post_replies.find({"$or" : [{"lang" : None}, {"lang" : {"$exists" : False}}]}).limit(100):
-        lang = detect_lang(current_post, lang_detector, lmtz)
-        bulk_updates.append(UpdateOne({"_id" : current_post["_id"]}, {"$set" : {"lang" : lang}}))
-
-    # Do changes
-    if len(bulk_updates) > 0:
-        MongoDB.post_replies.bulk_write(bulk_updates, ordered=False)
+def detection_stage(detect_queue : Queue, write_queue : Queue, pool : ProcessPoolExecutor, workers : int) -> None:
+    '''Splits every page into chunks for all cores and hands the futures to the writer'''
+    while 1:
+        source, docs = get(detect_queue)
+        chunk_size = max(1, -(-len(docs) // workers))
+        futures = [
+            pool.submit(detect_langs, [{key : doc[key] for key in TEXT_FIELDS if key in doc} for doc in docs[i:i + chunk_size]])
+            for i in range(0, len(docs), chunk_size)
+        ]
+        put(write_queue, (source, docs, futures))
+        detect_queue.task_done()
+
+def writer_stage(write_queue : Queue) -> None:
+    '''Waits for detected langs and writes them'''
+    while 1:
+        source, docs, futures = get(write_queue)
+        start_time = time.time()
+        langs = []
+        for future in futures:
+            langs += future.result()
 
-    return len(bulk_updates)
+        SOURCES[source][1](docs, langs)
+        print(f"[INFO] Detected langs for {len(docs)} {source} in {(time.time() - start_time) * 1000}ms")
+        write_queue.task_done()
 
-def run() -> None:
-    '''Main Function: Runs endless to detect all langs'''
+def init() -> None:
     MongoDB.init_global(post_table=True)
     helper.init()
 
-    while 1:
-        counter, start_time = 0, time.time()
-        counter += get_for_nativeposts()
-        counter += get_for_stockcomments()
-        counter += get_for_replies()
-
-        # Send heartbeat
-        elapsed_time = (time.time() - start_time) * 1000
-        payload = {'msg': 'OK', 'ping' : elapsed_time}        
-        do_heartbeat("LANG_DETECTOR", params=payload)    
-
-        if counter == 0:
-            time.sleep(10)   
-        else:
-            print(f"[INFO] Detected langs for {counter} posts in {elapsed_time}ms")   
-
+def run_pipeline(exit_when_idle : bool = False) -> None:
+    '''
+    Runs endless to detect all langs. The reader runs here, detection and writing in own stages.
+    exit_when_idle: returns after a whole pass without open docs (load tests)
+    '''
+    workers = os.cpu_count() or 1
+    detect_queue, write_queue = Queue(maxsize=QUEUE_SIZE), Queue(maxsize=QUEUE_SIZE)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        run_stage(detection_stage, detect_queue, write_queue, pool, workers)
+        run_stage(writer_stage, write_queue)
+
+        last_ids = {source : None for source in SOURCES.keys()}
+        pass_counter = 0 # docs read since starting from the beginning
+        while 1:
+            # Read (prefetch) one page of every source
+            progressed, start_time = False, time.time()
+            for source, (read, _) in SOURCES.items():
+                last_id, docs = read(last_ids[source])
+                if len(docs) > 0:
+                    put(detect_queue, (source, docs))
+                    pass_counter += len(docs)
+
+                progressed = progressed or last_id != last_ids[source]
+                last_ids[source] = last_id
+
+            # Send heartbeat
+            elapsed_time = (time.time() - start_time) * 1000
+            payload = {'msg': 'OK', 'ping' : elapsed_time}        
+            do_heartbeat("LANG_DETECTOR", params=payload)    
+
+            if not progressed:
+                # Reached the end: wait for all open pages and start from the beginning
+                drain(detect_queue, write_queue)
+                if pass_counter == 0:
+                    if exit_when_idle:
+                        return
+                    time.sleep(10) # Nothing to do
+
+                last_ids = {source : None for source in SOURCES.keys()}
+                pass_counter = 0
 
 
+def run() -> None:
+    '''Main Function'''
+    init()
+    run_pipeline()
 
 def start() -> None:
     run()
 
 if __name__ == '__main__':
    start()
-
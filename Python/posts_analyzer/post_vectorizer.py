@@ -1,6 +1,5 @@
 import asyncio
 
-import motor.motor_asyncio
 import numpy as np
 from pymongo import UpdateOne
 
@@ -9,6 +8,8 @@ import sys, os
 sys.path.append(os.getcwd() + "/.")
 
 from config import *
+from database import get_motor_client
+from word_vectors import get_word_vector_source
 
 FIND_NATIVE_AGG_PIPELINE = [
     {
@@ -44,8 +45,12 @@ FIND_STOCK_AGG_PIPELINE = [
     }      
 ]
 
-mongo_client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_CONNECTION_STR)
+mongo_client = get_motor_client()
 os_client = get_opensearch_client()
+word_vectors = get_word_vector_source(mongo_client["fasttext"]) # WordVectorStore or WordVectorCache
+
+class statics:
+    FASTTEXT_LANGS : list = None # collection names of the fasttext database
 
 
 def preprocess_text(text : str) -> str:
@@ -61,109 +66,144 @@ def preprocess_text(text : str) -> str:
     text = text.replace("'", " ' ").replace("\"", " \" ")
     return text.lower()
 
-async def get_tokens(post_id : int, image_api = False) -> tuple:
-    # Get post from database, then preprocess and tokenize it
+def get_text_collection(image_api = False):
+    if not image_api:
+        return mongo_client["hive-discover"]["post_text"] # General Post from the Blockchain
+    return mongo_client["images"]["post_text"] # Hive Stock Image Post
+
+def tokenize(text_doc : dict, image_api = False) -> list:
+    # Preprocess and tokenize a post_text document
     if not image_api:
-        # General Post from the Blockchain
-        text_doc = await mongo_client["hive-discover"]["post_text"].find_one({'_id': post_id})
         text = text_doc['title'] + " " + text_doc['body']
     else:
-        # Hive Stock Image Post
-        text_doc = await mongo_client["images"]["post_text"].find_one({'_id': post_id})
         text = text_doc["text"].replace("\n", " ").replace("-", " ").replace("_", " ").replace("+", " ").replace("&", " ")
 
-    # Tokenize
     text = preprocess_text(text)
-    all_tokens = text.split()
+    return text.split()
+
+async def get_tokens(post_id : int, image_api = False) -> tuple:
+    # Get post from database, then preprocess and tokenize it
+    text_doc = await get_text_collection(image_api).find_one({'_id': post_id})
+    all_tokens = tokenize(text_doc, image_api)
     unique_tokens = list(set(all_tokens))
     return (all_tokens, unique_tokens)
 
-async def init_matrices(post_id : int, unique_tokens : list, image_api=False) -> tuple:
-    # Init tf- and idf-matrices
-    lang_tf_matrix = {} # { "en" : {tokene1 : counte1}, "ru" : {tokene1 : counte1} }"}
-    lang_idf_matrix = {}# { "en" : {tokene1 : idf1e}, "ru" : {tokene1 : idf1} }"}
+async def get_fasttext_langs() -> list:
+    '''Returns all languages of the fasttext database (requested once per process)'''
+    if statics.FASTTEXT_LANGS is None:
+        statics.FASTTEXT_LANGS = await mongo_client["fasttext"].list_collection_names()
+    return statics.FASTTEXT_LANGS
 
+async def get_post_langs(post_ids : list, image_api=False) -> dict:
+    '''Returns the langs of posts ({post_id : ["en", "ru"]}) which are also in the fasttext database'''
+    post_langs = {post_id : [] for post_id in post_ids}
     if not image_api:
-        # Get post-langs from a native-post
-        post_langs = await mongo_client["hive-discover"]["post_data"].find_one({'_id': post_id}, projection={"lang" : 1})
-        if not post_langs or not post_langs["lang"]: # No Lang was calculated
-            return ({}, {})
+        # Get post-langs from native-posts
+        async for post in mongo_client["hive-discover"]["post_data"].find({'_id': {"$in" : post_ids}}, projection={"lang" : 1}):
+            if not post.get("lang", None): # No Lang was calculated
+                continue
 
-        post_langs = post_langs["lang"] # [{lang : en, x : 0.4}, {lang : ru, x : 0.6}]
-        post_langs = [item["lang"] for item in post_langs]
+            # [{lang : en, x : 0.4}, {lang : ru, x : 0.6}]
+            post_langs[post["_id"]] = [item["lang"] for item in post["lang"]]
     else:
         # ImageAPI only supports english content
-        post_langs = ["en"]
-
-    # Fill lists with zeros and idf-scores
-    for lang in await mongo_client["fasttext"].list_collection_names():
-        if lang not in post_langs:
-            continue # Skip languages not in post-langs
-
-        async for doc in mongo_client["fasttext"][lang].find({"_id" : {"$in" : unique_tokens}}, projection={"v" : 0}):
-            if lang not in lang_idf_matrix:
-                # First item of that lang
-                lang_tf_matrix[lang] = {}
-                lang_idf_matrix[lang] = {}
-
-            lang_tf_matrix[lang][doc['_id']] = 0
-           # if not image_api:
-            lang_idf_matrix[lang][doc['_id']] = doc['idf']
-            #else:
-           #     lang_idf_matrix[lang][doc['_id']] = doc['img_idf']
-
-
-    return (lang_tf_matrix, lang_idf_matrix)
-
-async def calc_tf_idf_scores(post_id : int, image_api=False) -> dict:
-    all_tokens, unique_tokens = await get_tokens(post_id, image_api)
+        post_langs = {post_id : ["en"] for post_id in post_ids}
+
+    fasttext_langs = await get_fasttext_langs()
+    return {post_id : [lang for lang in fasttext_langs if lang in langs] for post_id, langs in post_langs.items()}
+
+def init_matrices(unique_tokens : list, entries : dict) -> tuple:
+    '''
+    Aligns the looked up entries ({token : (vector, idf)}) of one language to the unique tokens.
+    Returns (known : bool-mask over unique_tokens, idf : np.array[float64], vectors : np.array[float32]) of the known tokens
+    or None when no token is known
+    '''
+    known = np.array([token in entries for token in unique_tokens], dtype=bool)
+    if not known.any():
+        return None # No token of that lang
+
+    known_tokens = [token for token in unique_tokens if token in entries]
+    idf = np.array([entries[token][1] for token in known_tokens], dtype=np.float64)
+    vectors = np.stack([entries[token][0] for token in known_tokens])
+    return (known, idf, vectors)
+
+def calc_doc_vector(inverse : np.ndarray, counts : np.ndarray, known : np.ndarray, idf : np.ndarray, vectors : np.ndarray) -> np.ndarray:
+    '''
+    Calculates the tf-idf weighted document vector of one language:
+        inverse : index of the unique token for every token of the post (np.unique)
+        counts : count of every unique token
+        known, idf, vectors : bool-mask over unique tokens and the idf-scores / word-vectors of the known ones
+    '''
+    # tf(t) = n(t) / known_tokens(lang)
+    # x = tf(t) * idf(t)
+    known_rows = np.full(len(known), -1, dtype=np.int64)
+    known_rows[known] = np.arange(np.count_nonzero(known))
+    weights = ((counts[known] / counts[known].sum()) * idf).astype(np.float32)
 
-    # Init tf- and idf-matrices
-    lang_tf_matrix = {} # { "en" : {tokene1 : counte1}, "ru" : {tokene1 : counte1r} }"}
-    lang_idf_matrix = {} # { "en" : {tokene1 : idf1e}, "ru" : {tokene1 : idf1r} }"}
-    lang_tf_matrix, lang_idf_matrix = await init_matrices(post_id, unique_tokens, image_api)
+    # Every occurrence of a known token adds its weighted vector. The sum over axis 0 adds
+    # the rows one after another in token order => same float32 result as adding them in a loop
+    occurrences = known_rows[inverse]
+    occurrences = occurrences[occurrences >= 0]
+    return (vectors[occurrences] * weights[occurrences, None]).sum(axis=0, dtype=np.float32)
 
-    # Count term-frequency for each token and for each language
-    known_token_count = {} # {"en" : 0, "ru", 0}
-    for token in all_tokens:
-        for lang in lang_tf_matrix.keys():
-            if lang not in known_token_count: # Add entry for that lang
-                known_token_count[lang] = 0
+def calc_weighted_vectors(all_tokens : list, post_langs : list, lang_entries : dict) -> dict:
+    '''Calculates the weighted vector of a post for every lang from looked up entries ({lang : {token : (vector, idf)}})'''
+    if len(all_tokens) == 0:
+        return {}
 
-            if token in lang_tf_matrix[lang]: # Check token
-                lang_tf_matrix[lang][token] += 1
-                known_token_count[lang] += 1
-
-    # Calculate tf-idf combined for each token and for each language
-    # tf(t) = n(t) / known_tokens(lang)
-    # x = tf(t) * idf(t)
-    for lang in lang_tf_matrix.keys():
-        for token in lang_tf_matrix[lang].keys():
-            lang_tf_matrix[lang][token] = (lang_tf_matrix[lang][token] / known_token_count[lang]) * lang_idf_matrix[lang][token]
+    # Count term-frequency for each unique token
+    unique_tokens, inverse, counts = np.unique(all_tokens, return_inverse=True, return_counts=True)
+    unique_tokens = unique_tokens.tolist()
 
     # Weight word-vectors with tf-idf score and add all for every lang
     lang_weighted_vectors = {} # {lang : weighed vector (np array)}
-    for lang in lang_tf_matrix.keys():
-        # Find vector for this lang and this post
-        post_vectors = {} # {token (str) : vector (np array)}
-        async for document in  mongo_client["fasttext"][lang].find({"_id" : {"$in" : unique_tokens}}):
-            # Also decode base64
-            post_vectors[document['_id']] = np.frombuffer(document['v'], dtype=np.float32)
-
-        # Calculate weighted vectors
-        lang_weighted_vectors[lang] = np.zeros(300, dtype=np.float32)
-        for token in all_tokens:
-            if token not in post_vectors:
-                continue # not this language
-        
-            # Add weighted vector
-            lang_weighted_vectors[lang] += post_vectors[token] * lang_tf_matrix[lang][token]
+    for lang in post_langs:
+        matrices = init_matrices(unique_tokens, lang_entries[lang])
+        if matrices is None:
+            continue # No token of that lang
 
-    return lang_weighted_vectors
+        known, idf, vectors = matrices
+        lang_weighted_vectors[lang] = calc_doc_vector(inverse, counts, known, idf, vectors)
 
-async def process_one_native_post(post_id: int) -> tuple:    
-    lang_weighted_vectors = await calc_tf_idf_scores(post_id, image_api=False)   
+    return lang_weighted_vectors
 
+async def calc_tf_idf_scores(post_id : int, image_api=False) -> dict:
+    '''Fetch-and-compute routine of a post: one lookup (idf and vectors) per language'''
+    all_tokens, unique_tokens = await get_tokens(post_id, image_api)
+    post_langs = (await get_post_langs([post_id], image_api))[post_id]
+
+    lang_entries = {} # {lang : {token : (vector, idf)}}
+    for lang in post_langs:
+        lang_entries[lang] = await word_vectors.lookup(lang, unique_tokens)
+
+    return calc_weighted_vectors(all_tokens, post_langs, lang_entries)
+
+async def calc_tf_idf_scores_batch(post_ids : list, image_api=False) -> dict:
+    '''
+    Batch mode of calc_tf_idf_scores: tokenizes all posts first, then does one lookup per language 
+    for the union of all tokens and calculates every post from that shared map.
+    Returns {post_id : lang_weighted_vectors}
+    '''
+    # Get and tokenize all texts
+    post_tokens = {} # {post_id : all_tokens}
+    async for text_doc in get_text_collection(image_api).find({"_id" : {"$in" : post_ids}}):
+        post_tokens[text_doc["_id"]] = tokenize(text_doc, image_api)
+    post_langs = await get_post_langs(list(post_tokens.keys()), image_api)
+
+    # Union of all tokens per language
+    lang_tokens = {} # {lang : set(tokens)}
+    for post_id, all_tokens in post_tokens.items():
+        for lang in post_langs[post_id]:
+            lang_tokens.setdefault(lang, set()).update(all_tokens)
+
+    # One lookup per language (concurrently)
+    langs = list(lang_tokens.keys())
+    lookups = await asyncio.gather(*[word_vectors.lookup(lang, list(lang_tokens[lang])) for lang in langs])
+    lang_entries = dict(zip(langs, lookups)) # {lang : {token : (vector, idf)}}
+
+    return {post_id : calc_weighted_vectors(all_tokens, post_langs[post_id], lang_entries) for post_id, all_tokens in post_tokens.items()}
+
+def native_post_updates(post_id : int, lang_weighted_vectors : dict) -> tuple:
     os_update = [
         {"update" : {"_index" : "hive-post-data", "_id" : post_id}}, # metadata
         {"doc" : {"doc_vector" : dict(lang_weighted_vectors)}} # Document
@@ -185,9 +225,11 @@ async def process_one_native_post(post_id: int) -> tuple:
 
     return (mongo_update, os_update)
 
-async def process_one_stock_post(post_id: int) -> UpdateOne:    
-    lang_weighted_vectors = await calc_tf_idf_scores(post_id, image_api=True)   
+async def process_one_native_post(post_id: int) -> tuple:    
+    lang_weighted_vectors = await calc_tf_idf_scores(post_id, image_api=False)   
+    return native_post_updates(post_id, lang_weighted_vectors)
 
+def stock_post_update(post_id : int, lang_weighted_vectors : dict) -> UpdateOne:
     # Get binary from np.array
     if "en" in lang_weighted_vectors: # english-content exists
         lang_weighted_vectors = lang_weighted_vectors["en"].tobytes()
@@ -204,20 +246,28 @@ async def process_one_stock_post(post_id: int) -> UpdateOne:
     }
     return UpdateOne({"_id" : post_id}, update)
 
+async def process_one_stock_post(post_id: int) -> UpdateOne:    
+    lang_weighted_vectors = await calc_tf_idf_scores(post_id, image_api=True)   
+    return stock_post_update(post_id, lang_weighted_vectors)
+
 
 async def manage_native_posts() -> None:
     # Find native posts where work is needed
-    tasks = []
-    async for post_id in mongo_client["hive-discover"]["post_data"].aggregate(FIND_NATIVE_AGG_PIPELINE):   
-        tasks.append(process_one_native_post(post_id["_id"]))
-
-    if len(tasks) == 0:
+    post_ids = [post["_id"] async for post in mongo_client["hive-discover"]["post_data"].aggregate(FIND_NATIVE_AGG_PIPELINE)]
+    if len(post_ids) == 0:
         return 0
 
-    bulks = await asyncio.gather(*tasks)
+    # Vectorize the whole batch at once
+    results = await calc_tf_idf_scores_batch(post_ids, image_api=False)
+    bulks = [native_post_updates(post_id, lang_weighted_vectors) for post_id, lang_weighted_vectors in results.items()]
+
+    # Posts without post_text: mark them (empty doc_vectors), so they are not sampled again
+    missing_ids = [post_id for post_id in post_ids if post_id not in results]
+    if len(missing_ids) > 0:
+        print(f"[INFO] No post_text for native-posts {missing_ids}: marked without doc_vectors")
 
     # Update posts in MongoDB
-    bulk_update = [x for x,_ in bulks if x] # Remove None's and filter
+    bulk_update = [x for x,_ in bulks if x] + [native_post_updates(post_id, {})[0] for post_id in missing_ids]
     if len(bulk_update) > 0:
         await mongo_client["hive-discover"]["post_data"].bulk_write(bulk_update, ordered=False)
 
@@ -230,27 +280,30 @@ async def manage_native_posts() -> None:
          os_client.bulk(body=bulk_update, index="hive-post-data")
 
     # Logging
-    print(f"[INFO] Vectorized {len(bulk_update)} native-posts")
+    print(f"[INFO] Vectorized {len(bulk_update)} native-posts. Word-Vector-Cache: {word_vectors.stats()}")
     return len(bulk_update)
 
 async def manage_stock_posts() -> None:
     # Find stock posts where work is needed
-    tasks = []
-    async for post_id in mongo_client["images"]["post_text"].aggregate(FIND_STOCK_AGG_PIPELINE):   
-        tasks.append(process_one_stock_post(post_id["_id"]))
-
-    if len(tasks) == 0:
+    post_ids = [post["_id"] async for post in mongo_client["images"]["post_text"].aggregate(FIND_STOCK_AGG_PIPELINE)]
+    if len(post_ids) == 0:
         return 0
 
-    # Update posts
-    bulk_update = await asyncio.gather(*tasks)
-    bulk_update = [x for x in bulk_update if x] # Remove None's
+    # Vectorize the whole batch at once and update posts
+    results = await calc_tf_idf_scores_batch(post_ids, image_api=True)
+    bulk_update = [stock_post_update(post_id, lang_weighted_vectors) for post_id, lang_weighted_vectors in results.items()]
+
+    # Posts without text (deleted in the meantime): doc_vectors = False, so they are not sampled again
+    missing_ids = [post_id for post_id in post_ids if post_id not in results]
+    if len(missing_ids) > 0:
+        print(f"[INFO] No text for stock-posts {missing_ids}: marked without doc_vectors")
+        bulk_update += [stock_post_update(post_id, {}) for post_id in missing_ids]
     if len(bulk_update) > 0:
         await mongo_client["images"]["post_text"].bulk_write(bulk_update, ordered=False)
 
     # Logging
-    print(f"[INFO] Vectorized {len(tasks)} stock-posts")
-    return len(tasks)
+    print(f"[INFO] Vectorized {len(post_ids)} stock-posts")
+    return len(post_ids)
 
 async def main() -> None: 
     while 1:
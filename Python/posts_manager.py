@@ -10,56 +10,59 @@ from pymongo.errors import BulkWriteError
 from beem.comment import Comment
 from beem.exceptions import ContentDoesNotExistsException
 
-import secrets
 import json
 import asyncio
+import numpy as np
 import time
 from datetime import datetime, timedelta
 
 async def generate_post_ids(amount : int = 1) -> list:
-    '''Generate some unused ids'''
-    choosed = set([])
-    while len(choosed) < amount:
-        some_ids = [secrets.randbelow(2000000000) for _ in range(10 * amount * 2)]
-        async for used_ids in MongoDBAsync.post_info.find({"_id" : {"$in" : some_ids}}, {"_id" : 1}):
-            some_ids.remove(used_ids["_id"])
-        
-        for _id in some_ids:
-            choosed.add(_id)
-
-    return list(choosed)[0:amount]
+    '''Generate some unused ids (reserved blocks of database.IdAllocator, no probing)'''
+    return await MongoDBAsync.post_ids.allocate_async(amount)
 
 
 #   *** Append Posts ***
+def authorperm_filter(posts : list) -> dict:
+    '''Query of exactly these posts (tuple(author, permlink)), without the cross product of author $in / permlink $in'''
+    return {"$or" : [{"author" : author, "permlink" : permlink} for author, permlink in set(posts)]}
+
 async def remove_banned_listed(authors : list, permlinks : list, post_ids : list = None) -> list:
     '''Remove all banned/listed posts by settings _id to -1'''
     if not post_ids or len(post_ids) != len(authors):
         # If it is not setted or wrong
         post_ids = [0 for _ in authors]
-
-    # Remove banned accounts
-    async def remove_banned_accounts():
-        async for banned in MongoDBAsync.banned.find({"name" : {"$in" : authors}}):
-            for index, _ in enumerate(authors):
-                if authors[index] == banned["name"]:
-                    post_ids[index] = -1
-
-    # Remove banned posts
-    async def remove_banned_posts():
-        async for banned in MongoDBAsync.banned.find({"author" : {"$in" : authors}, "permlink" : {"$in" : permlinks}}):
-            for index, _ in enumerate(authors):
-                if authors[index] == banned["author"] and permlinks[index] == banned["permlink"]:
-                    post_ids[index] = -1
-
-    # Find listed posts
-    async def remove_listed_posts():
-        async for post in MongoDBAsync.post_info.find({"author" : {"$in" : authors}, "permlink" : {"$in" : permlinks}}):
-            for index, _ in enumerate(authors):
-                if authors[index] == post["author"] and permlinks[index] == post["permlink"]:
-                    post_ids[index] = post["_id"]
-    
-    # Filter all out
-    await asyncio.gather(remove_banned_accounts(), remove_banned_posts(), remove_listed_posts())
+    if len(authors) == 0:
+        return post_ids
+
+    author_positions = helper.index_positions(authors)
+    post_positions = helper.index_positions(zip(authors, permlinks))
+
+    # Banned accounts and posts
+    async def find_banned() -> list:
+        banned_names, banned_posts = set(), set()
+        async for banned in MongoDBAsync.banned.find({"$or" : [{"name" : {"$in" : list(author_positions.keys())}}, authorperm_filter(post_positions.keys())]}):
+            if "name" in banned:
+                banned_names.add(banned["name"])
+            else:
+                banned_posts.add((banned["author"], banned["permlink"]))
+
+        return [index for name in banned_names for index in author_positions.get(name, [])] \
+                + [index for post in banned_posts for index in post_positions.get(post, [])]
+
+    # Listed posts
+    async def find_listed() -> dict:
+        listed = {}
+        async for post in MongoDBAsync.post_info.find(authorperm_filter(post_positions.keys()), {"author" : 1, "permlink" : 1}):
+            for index in post_positions.get((post["author"], post["permlink"]), []):
+                listed[index] = post["_id"]
+        return listed
+
+    # Filter all out (banned wins over listed)
+    banned, listed = await asyncio.gather(find_banned(), find_listed())
+    for index, _id in listed.items():
+        post_ids[index] = _id
+    for index in banned:
+        post_ids[index] = -1
     return post_ids
 
 def remove_comments(posts : list, post_ids : list = None) -> list:
@@ -91,14 +94,13 @@ async def append_posts(posts : list) -> list:
         return []
 
     post_ids = [0 for _ in posts]
-    open_ids = await generate_post_ids(len(posts))
 
     # Remove banned and comments
     post_ids = await remove_banned_listed([x["author"] for x in posts], [x["permlink"] for x in posts], post_ids)
     post_ids = remove_comments(posts, post_ids)
 
     # Prepare posts and texts
-    post_infos, post_texts, post_data = [], [], []
+    new_posts = [] # (index, post, title, body, tag_str, timestamp)
     for index, post in enumerate(posts):
         if post_ids[index] != 0:
             # Banned, inside or something else
@@ -139,24 +141,41 @@ async def append_posts(posts : list) -> list:
             post_ids[index] = -1
             continue
         
-        post_ids[index] = open_ids[index]
-        post_infos.append({"_id" : open_ids[index], "author" : post["author"], "permlink" : post["permlink"], "timestamp" : timestamp})
-        post_texts.append({"_id" : open_ids[index], "title" : title, "body" : body, "tag_str" : tag_str, "timestamp" : timestamp})
-        post_data.append({"_id" : open_ids[index], "categories" : None, "lang" : None, "timestamp" : timestamp})
+        new_posts.append((index, post, title, body, tag_str, timestamp))
 
-    # Append all
+    # Ids only for the new posts
+    post_infos, post_texts, post_data = [], [], []
+    open_ids = await generate_post_ids(len(new_posts))
+    for _id, (index, post, title, body, tag_str, timestamp) in zip(open_ids, new_posts):
+        post_ids[index] = _id
+        post_infos.append({"_id" : _id, "author" : post["author"], "permlink" : post["permlink"], "timestamp" : timestamp})
+        post_texts.append({"_id" : _id, "title" : title, "body" : body, "tag_str" : tag_str, "timestamp" : timestamp})
+        post_data.append({"_id" : _id, "categories" : None, "lang" : None, "timestamp" : timestamp})
+
+    # Append all (concurrently)
     if len(post_data) > 0:
-
-        try:         
-            await MongoDBAsync.post_info.insert_many(post_infos)
-            # If it reaches here, it was succesfull and the other things will also success
-            await asyncio.wait([ MongoDBAsync.post_data.insert_many(post_data),
-                                 MongoDBAsync.post_text.insert_many(post_texts)])
-        except BulkWriteError:
-            pass
+        collections = (MongoDBAsync.post_info, MongoDBAsync.post_data, MongoDBAsync.post_text)
+        failed = await asyncio.gather(*[insert_unordered(collection, documents) for collection, documents in zip(collections, (post_infos, post_data, post_texts))])
+
+        # Only complete posts stay: remove the documents of failed posts, which landed in the other collections
+        all_failed = set().union(*failed)
+        if len(all_failed) > 0:
+            await asyncio.gather(*[collection.delete_many({"_id" : {"$in" : list(all_failed - failed_ids)}})
+                                    for collection, failed_ids in zip(collections, failed) if len(all_failed - failed_ids) > 0])
+            for _id, (index, *_) in zip(open_ids, new_posts):
+                if _id in all_failed:
+                    post_ids[index] = -1
 
     return post_ids
 
+async def insert_unordered(collection, documents : list) -> set:
+    '''Inserts all documents (ordered=False, so one error does not stop the others). Returns the _ids which were not inserted'''
+    try:
+        await collection.insert_many(documents, ordered=False)
+    except BulkWriteError as ex:
+        return set(documents[error["index"]]["_id"] for error in ex.details.get("writeErrors", []))
+    return set()
+
 
 async def remove_posts(posts : list) -> None:
     '''Delete some posts. Posts can be _id, authors or tuple of author, permlink'''
@@ -191,14 +210,14 @@ async def authorperm_to_id(posts : list) -> list:
     '''Get _id field of posts. -1 if it does not exist. Posts has to be tuple(author, permlink)'''
     # Prepare
     post_ids = [-1 for _ in posts]
-    authors = [author for author, _ in posts]
-    permlinks = [permlink for _, permlink in posts]
+    if len(posts) == 0:
+        return post_ids
+    positions = helper.index_positions((author, permlink) for author, permlink in posts)
 
     # Find and Set _ids
-    async for post in MongoDBAsync.post_info.find({"author" : {"$in" : authors}, "permlink" : {"$in" : permlinks}}):
-        for index, (author, permlink) in enumerate(posts):
-            if author == post["author"] and permlink == post["permlink"]:
-                post_ids[index] = post["_id"]
+    async for post in MongoDBAsync.post_info.find(authorperm_filter(positions.keys()), {"author" : 1, "permlink" : 1}):
+        for index in positions.get((post["author"], post["permlink"]), []):
+            post_ids[index] = post["_id"]
 
     return post_ids
 
@@ -219,12 +238,15 @@ async def add_votes_to_posts(voters : list, posts : list):
     if isinstance(voters[0], str):
         voters = await username_to_id(voters)
 
-    # Check if they are inside account_data (if they are analyzed) --> Make bulk list
-    bulk_update = []
-    async for account_data in MongoDBAsync.account_data.find({"_id" : {"$in" : voters}}):
-        for voter_id, post_id in zip(voters, posts):
-            if account_data["_id"] == voter_id and post_id >= 0:
-                bulk_update.append(UpdateOne({"_id" : post_id}, {"$addToSet" : {"votes" : voter_id}}))
+    # Only voters inside account_data (analyzed ones)
+    analyzed = set([account_data["_id"] async for account_data in MongoDBAsync.account_data.find({"_id" : {"$in" : list(set(voters))}}, {"_id" : 1})])
+
+    # Group votes by post --> one update per post
+    post_votes = {}
+    for voter_id, post_id in zip(voters, posts):
+        if voter_id in analyzed and post_id >= 0:
+            post_votes.setdefault(post_id, {})[voter_id] = None # dict keeps the order and removes doubled votes
+    bulk_update = [UpdateOne({"_id" : post_id}, {"$addToSet" : {"votes" : {"$each" : list(voter_ids)}}}) for post_id, voter_ids in post_votes.items()]
     
     # Make changes
     if len(bulk_update) > 0:
@@ -233,125 +255,214 @@ async def add_votes_to_posts(voters : list, posts : list):
         except BulkWriteError:
             pass
 
-class PostsCleaner():
-    async def start(self):
-        self.post_info_cursor = MongoDBAsync.post_info.find({})
-        self.total_post_info = await MongoDBAsync.post_info.count_documents({})
-        self.total_post_data = await MongoDBAsync.post_data.count_documents({})
-        self.total_post_text = await MongoDBAsync.post_text.count_documents({})
-
-        if self.total_post_info == self.total_post_data and self.total_post_info == self.total_post_text:
-            # Everything is fine
+class VoteBuffer():
+    '''
+    Collects votes of many blocks and writes them with add_votes_to_posts, when max_size votes are collected
+    or the oldest vote waits for max_seconds. Voters and posts have to be given in the same form in every call 
+    (usernames / _ids and tuple(author, permlink) / _ids).
+    run() has to be running for the time-based flushes
+    '''
+    def __init__(self, max_size : int = VOTE_BUFFER_SIZE, max_seconds : float = VOTE_BUFFER_SECONDS) -> None:
+        self.max_size, self.max_seconds = max_size, max_seconds
+        self.voters, self.posts = [], []
+        self.first_timestamp = None # time of the oldest vote in the buffer
+        self.flush_lock = asyncio.Lock()
+
+    async def add(self, voters : list, posts : list) -> None:
+        '''Adds votes (len of voters and posts has to be equal)'''
+        if len(voters) == 0 or len(voters) != len(posts):
             return
+        if len(self.voters) == 0:
+            self.first_timestamp = time.time()
+
+        self.voters += voters
+        self.posts += posts
+        if len(self.voters) >= self.max_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        '''Writes all collected votes'''
+        async with self.flush_lock:
+            voters, posts = self.voters, self.posts
+            self.voters, self.posts, self.first_timestamp = [], [], None
+            if len(voters) > 0:
+                await add_votes_to_posts(voters, posts)
+
+    async def run(self) -> None:
+        '''Flushes the buffer, when the oldest vote waits for max_seconds'''
+        while 1:
+            if self.first_timestamp is not None and time.time() - self.first_timestamp >= self.max_seconds:
+                await self.flush()
+            await asyncio.sleep(min(1, self.max_seconds / 5))
 
-        # There are diffs
-        print("There are some corrupted posts:")
-        print(f"    Difference post_data: {self.total_post_info - self.total_post_data}")
-        print(f"    Difference post_text: {self.total_post_info - self.total_post_text}")
-        print("---  clean db  ---")
-
-        self.corrupted_ids = []
-        self.open_ids = []
-        self.running, self.open_ids_checking = True, False
-        await asyncio.wait([self.run(), self.check_open_ids()])
-        
-    async def check_open_ids(self):
-        self.open_ids_checking = True
-        while self.running or len(self.open_ids) > 0:
-            while len(self.open_ids) == 0:
-                await asyncio.sleep(1)
-
-            current_ids = self.open_ids[::]
-            self.open_ids = []
-
-            # Get available ids from db
-            post_data_ids = [post["_id"] async for post in MongoDBAsync.post_data.find({"_id" : {"$in" : current_ids}}, {"_id" : 1})]
-            post_text_ids = [post["_id"] async for post in MongoDBAsync.post_text.find({"_id" : {"$in" : current_ids}}, {"_id" : 1})]
-
-            # Check if post_info id is inside
-            for _id in current_ids:
-                if _id not in post_data_ids or _id not in post_text_ids:
-                    # _id is not inside -> curropted
-                    self.corrupted_ids.append(_id)
-
-        self.open_ids_checking = False
-
-    async def get_comments(self) -> list:
-        '''Return list of comments'''
-        posts = []
+class PostsCleaner():
+    '''
+    Consistency check of post_info, post_data and post_text: the sorted _ids of all three collections are streamed 
+    range by range (only {_id : 1}) and merge-joined. Posts missing in post_data or post_text are fetched again 
+    from the chain (bounded concurrency) and appended. post_data / post_text documents without post_info are deleted.
+    Only _ids up to the highest post_info _id at the start are checked, and all found ids are checked again 
+    after grace_seconds: posts inserted meanwhile (post_data / post_text can be written before post_info) are left alone.
+    '''
+    def __init__(self, chunk_size : int = CONSISTENCY_CHUNK_SIZE, concurrency : int = CHAIN_FETCH_CONCURRENCY, 
+                    grace_seconds : float = CONSISTENCY_GRACE_SECONDS) -> None:
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.grace_seconds = grace_seconds
+
+    @staticmethod
+    async def stream_ids(collection, lower : int = None, upper : int = None, limit : int = 0) -> np.ndarray:
+        '''Sorted _ids in (lower, upper] (no bound when None)'''
+        query = {}
+        if lower is not None:
+            query["$gt"] = lower
+        if upper is not None:
+            query["$lte"] = upper
+        cursor = collection.find({"_id" : query} if query else {}, {"_id" : 1}).sort("_id", 1)
+        if limit > 0:
+            cursor = cursor.limit(limit)
+        return np.array([doc["_id"] async for doc in cursor], dtype=np.int64)
+
+    async def id_ranges(self):
+        '''
+        Yields (post_info, post_data, post_text) _ids of consecutive ranges up to the highest post_info _id 
+        at the start (newer posts may not be complete yet)
+        '''
+        highest = await MongoDBAsync.post_info.find_one({}, {"_id" : 1}, sort=[("_id", -1)])
+        if highest is None:
+            return
+        high_water = int(highest["_id"])
+
+        lower = None
+        while 1:
+            info_ids = await PostsCleaner.stream_ids(MongoDBAsync.post_info, lower, high_water, limit=self.chunk_size)
+            upper = int(info_ids[-1]) if len(info_ids) == self.chunk_size else high_water
+            data_ids, text_ids = await asyncio.gather(
+                PostsCleaner.stream_ids(MongoDBAsync.post_data, lower, upper),
+                PostsCleaner.stream_ids(MongoDBAsync.post_text, lower, upper)
+            )
+            yield (info_ids, data_ids, text_ids)
+
+            if upper == high_water:
+                return
+            lower = upper
+
+    @staticmethod
+    def merge_diff(a : np.ndarray, b : np.ndarray) -> tuple:
+        '''Merge-join of two sorted, unique arrays. Returns (only in a, only in b)'''
+        merged = np.concatenate([a, b])
+        origin = np.concatenate([np.zeros(len(a), dtype=bool), np.ones(len(b), dtype=bool)])
+        order = np.argsort(merged, kind="stable") # merges the two sorted runs
+        merged, origin = merged[order], origin[order]
+
+        # Ids in both are neighbours
+        pairs = merged[1:] == merged[:-1]
+        single = np.ones(len(merged), dtype=bool)
+        single[1:] &= ~pairs
+        single[:-1] &= ~pairs
+        return (merged[single & ~origin], merged[single & origin])
+
+    async def check(self) -> tuple:
+        '''Returns (corrupted post_info _ids, post_data orphans, post_text orphans)'''
+        empty = np.empty(0, dtype=np.int64) # no range when post_info is empty
+        corrupted, data_orphans, text_orphans = [empty], [empty], [empty]
+        checked = 0
+        async for info_ids, data_ids, text_ids in self.id_ranges():
+            missing_data, orphans = PostsCleaner.merge_diff(info_ids, data_ids)
+            data_orphans.append(orphans)
+            missing_text, orphans = PostsCleaner.merge_diff(info_ids, text_ids)
+            text_orphans.append(orphans)
+            corrupted.append(np.union1d(missing_data, missing_text))
+
+            checked += len(info_ids)
+            print("", end=f"\r Checked: {checked}    Corrupted: {sum(len(ids) for ids in corrupted)}        ")
         print("")
-        async for post_info in MongoDBAsync.post_info.find({"_id" : {"$in" : self.corrupted_ids}}):
-            print("", end=f"\r Comments: {len(posts)} ({round(len(posts)/len(self.corrupted_ids), 5) * 100}%)             ")
-            start = time.time()
 
+        return tuple(np.concatenate(ids).tolist() for ids in (corrupted, data_orphans, text_orphans))
+
+    async def recheck(self, corrupted_ids : list, data_orphans : list, text_orphans : list) -> tuple:
+        '''
+        Checks the found ids again after grace_seconds (a post being inserted during the check is complete then).
+        Returns (corrupted post_info _ids, post_data orphans, post_text orphans) that are still inconsistent
+        '''
+        if len(corrupted_ids) == 0 and len(data_orphans) == 0 and len(text_orphans) == 0:
+            return ([], [], [])
+        await asyncio.sleep(self.grace_seconds)
+
+        async def find_ids(collection, ids : list) -> set:
+            return set([doc["_id"] async for doc in collection.find({"_id" : {"$in" : ids}}, {"_id" : 1})])
+
+        info_ids, orphan_info_ids, data_ids, text_ids = await asyncio.gather(
+            find_ids(MongoDBAsync.post_info, corrupted_ids),
+            find_ids(MongoDBAsync.post_info, data_orphans + text_orphans),
+            find_ids(MongoDBAsync.post_data, corrupted_ids),
+            find_ids(MongoDBAsync.post_text, corrupted_ids)
+        )
+        return (
+            [_id for _id in corrupted_ids if _id in info_ids and (_id not in data_ids or _id not in text_ids)],
+            [_id for _id in data_orphans if _id not in orphan_info_ids],
+            [_id for _id in text_orphans if _id not in orphan_info_ids]
+        )
+
+    async def get_comments(self, corrupted_ids : list) -> list:
+        '''Fetches the corrupted posts from the chain (concurrency requests at once). Deleted posts are left out'''
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_event_loop()
+
+        def get_comment(authorperm : str):
             try:
-                posts.append(Comment(f'@{post_info["author"]}/{post_info["permlink"]}'))
+                return Comment(authorperm)
             except ContentDoesNotExistsException:
-                # Do nothing, it will be deleted afterwards
-                continue
-            
-            # have a delay
-            diff = time.time() - start
-            if diff < 0.05:
-                await asyncio.sleep(0.05 - diff)
-        
-        print("", end="\r                       ")
-        print("")
-        return posts
+                return None # it will be deleted afterwards
 
-    async def run(self):
-        print("")
-        # Get all post_info ids
-        counter = 0
-        async for post in MongoDBAsync.post_info.find({}, {"_id" : 1}):
-            while len(self.open_ids) > 5000:
-                # To many in queue
-                await asyncio.sleep(1)
-
-            self.open_ids.append(post["_id"])
-
-            # Make loading bar
-            counter += 1
-            print("", end=f"\r Counter: {counter} ({round(counter/self.total_post_info, 5) * 100}%)    Corrupted: {len(self.corrupted_ids)}    Open Ids: {len(self.open_ids)}        ")
-        
-        # Finished, wait for open_ids checker to terminate
-        self.running = False
-        while self.open_ids_checking:
-            print("", end=f"\r Waiting for open_ids checker... Left: {len(self.open_ids)}                                                                                                   ")
-            await asyncio.sleep(1)
+        async def fetch(post_info : dict):
+            async with semaphore:
+                return await loop.run_in_executor(None, get_comment, f'@{post_info["author"]}/{post_info["permlink"]}')
+
+        post_infos = [post_info async for post_info in MongoDBAsync.post_info.find({"_id" : {"$in" : corrupted_ids}}, {"author" : 1, "permlink" : 1})]
+        posts = await asyncio.gather(*[fetch(post_info) for post_info in post_infos])
+        return [post for post in posts if post is not None]
 
-        # Be sure to only have once a posts
-        self.corrupted_ids = list(set(self.corrupted_ids))
+    async def start(self):
+        print("---  check posts  ---")
+        start_time = time.time()
+        corrupted_ids, data_orphans, text_orphans = await self.check()
+        corrupted_ids, data_orphans, text_orphans = await self.recheck(corrupted_ids, data_orphans, text_orphans)
 
         # Make statement
-        print("", end="\r")
-        print("")
         print("Final Report:")
-        print(f"     Corrupted ids: {len(self.corrupted_ids)}")
-        if len(self.corrupted_ids) == 0:
-            print("There are no corrupted ids. Aborting...")
+        print(f"     Corrupted ids: {len(corrupted_ids)}")
+        print(f"     Orphans in post_data: {len(data_orphans)}, in post_text: {len(text_orphans)}")
+        print(f"     Checked in {round(time.time() - start_time, 2)}s")
+
+        # Orphans can not be fetched again (no author / permlink)
+        if len(data_orphans) > 0 or len(text_orphans) > 0:
+            await asyncio.gather(
+                MongoDBAsync.post_data.delete_many({"_id" : {"$in" : data_orphans}}),
+                MongoDBAsync.post_text.delete_many({"_id" : {"$in" : text_orphans}})
+            )
+
+        if len(corrupted_ids) == 0:
+            print("There are no corrupted ids.")
             return
         print("--- fixing them ---")
         
         # Get comments
         print("Getting posts from blockchain...")
-        posts = await self.get_comments()
-        print(f"Got comments. Count: {len(posts)}   Removed Content: {len(self.corrupted_ids) - len(posts)}")
+        posts = await self.get_comments(corrupted_ids)
+        print(f"Got comments. Count: {len(posts)}   Removed Content: {len(corrupted_ids) - len(posts)}")
 
         # Delete ids
         print("Delete corrupted ids everywhere")
-        await asyncio.wait([
-            MongoDBAsync.post_info.delete_many({"_id" : {"$in" : self.corrupted_ids}}),
-            MongoDBAsync.post_text.delete_many({"_id" : {"$in" : self.corrupted_ids}}),
-            MongoDBAsync.post_data.delete_many({"_id" : {"$in" : self.corrupted_ids}})
-        ])
+        await asyncio.gather(
+            MongoDBAsync.post_info.delete_many({"_id" : {"$in" : corrupted_ids}}),
+            MongoDBAsync.post_text.delete_many({"_id" : {"$in" : corrupted_ids}}),
+            MongoDBAsync.post_data.delete_many({"_id" : {"$in" : corrupted_ids}})
+        )
 
         # Last step: Reappend
         print("Deleted ids. Reappend posts...")
         await append_posts(posts)
         print("Finished")
-            
-
 
 
 if __name__ == '__main__':
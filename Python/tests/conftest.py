@@ -0,0 +1,4 @@
+import sys, os
+
+# Modules of Python/ are imported flat (like the workers do)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,76 @@
+'''Parity of the fused CategorizerCNN with the per-model path (TextCNN / FakeNewsCNN on every post alone)'''
+import numpy as np
+import pytest
+import torch as T
+
+from network import TextCNN, FakeNewsCNN, CategorizerCNN, EMBEDDING_DIM
+
+# Invented, post-like sentences of different lengths (not recorded posts; the vectors below are synthetic anyway)
+TEXTS = [
+    "the market closed higher today after a week of losses",
+    "bitcoin and ethereum prices jumped while the fed kept interest rates unchanged for another month",
+    "my garden finally has tomatoes this year . i planted them in april and watered every morning before work",
+    "here is a short recipe : boil the pasta , fry garlic in olive oil , add chili and parsley , mix everything and serve with cheese . "
+    "it takes fifteen minutes and tastes better than most restaurants in town",
+    "hive",
+]
+MIN_LENGTH = 8 # largest window size (shorter posts are not categorized)
+
+
+def embed(text : str) -> np.ndarray:
+    '''Fixed word vectors: every token gets a vector seeded by its position in the sorted vocabulary'''
+    vocabulary = sorted(set(" ".join(TEXTS).split()))
+    tokens = text.split()
+    while len(tokens) < MIN_LENGTH:
+        tokens += tokens # like the unknown-tokens, short posts get longer
+    return np.stack([np.random.default_rng(vocabulary.index(token)).standard_normal(EMBEDDING_DIM).astype(np.float32) for token in tokens])
+
+def padded_batch(texts : list) -> tuple:
+    sequences = [embed(text) for text in texts]
+    lengths = [len(sequence) for sequence in sequences]
+    batch = np.zeros((len(sequences), max(lengths), EMBEDDING_DIM), dtype=np.float32)
+    for index, sequence in enumerate(sequences):
+        batch[index, :len(sequence)] = sequence
+    return (sequences, T.from_numpy(batch), T.tensor(lengths))
+
+def make_models(shared_trunk : bool) -> tuple:
+    T.manual_seed(0)
+    text_cnn, fakenews_cnn = TextCNN().eval(), FakeNewsCNN().eval()
+    if shared_trunk:
+        fakenews_cnn.convs.load_state_dict(text_cnn.convs.state_dict())
+    return (CategorizerCNN.from_models(text_cnn, fakenews_cnn), text_cnn, fakenews_cnn)
+
+
+@pytest.mark.parametrize("shared_trunk", [False, True])
+@pytest.mark.parametrize("texts", [TEXTS, TEXTS[:2], TEXTS[3:], [TEXTS[1]]])
+def test_fused_matches_per_model(shared_trunk : bool, texts : list):
+    model, text_cnn, fakenews_cnn = make_models(shared_trunk)
+    assert model.shared_trunk == shared_trunk
+
+    sequences, batch, lengths = padded_batch(texts)
+    with T.inference_mode():
+        categories, fakenews = model(batch, lengths=lengths)
+        for index, sequence in enumerate(sequences):
+            single = T.from_numpy(sequence).unsqueeze(0)
+            assert T.allclose(categories[index], text_cnn(single)[0], atol=1e-5)
+            assert T.allclose(fakenews[index], fakenews_cnn(single)[0], atol=1e-5)
+
+def test_padding_does_not_change_results():
+    model, _, _ = make_models(shared_trunk=False)
+    sequences, batch, lengths = padded_batch(TEXTS)
+    with T.inference_mode():
+        categories, fakenews = model(batch, lengths=lengths)
+        for index, sequence in enumerate(sequences):
+            alone = model(T.from_numpy(sequence).unsqueeze(0), lengths=lengths[index:index + 1])
+            assert T.allclose(categories[index], alone[0][0], atol=1e-5)
+            assert T.allclose(fakenews[index], alone[1][0], atol=1e-5)
+
+def test_load_model_is_in_eval_mode():
+    model, text_cnn, fakenews_cnn, _ = CategorizerCNN.load_model()
+    assert not model.training and not text_cnn.training and not fakenews_cnn.training
+
+    # No dropout: the same input gives the same output
+    _, batch, lengths = padded_batch(TEXTS)
+    with T.inference_mode():
+        first, second = model(batch, lengths=lengths), model(batch, lengths=lengths)
+    assert T.equal(first[0], second[0]) and T.equal(first[1], second[1])
@@ -0,0 +1,68 @@
+'''
+helper.html_to_text has to give the same text nodes as markdown + BeautifulSoup(...).findAll(text=True).
+fixtures/html_to_text.json holds inputs for both paths (plain text fast path and markdown + TextExtractor) 
+with the outputs of markdown + bs4.
+'''
+import json, os, random, warnings
+import pytest
+
+from helper import helper, MARKUP_PATTERN
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "html_to_text.json")
+
+WORDS = "hive post crypto the a of steem blockchain photo travel food great day 2021 1. - * # > = + ! ? : ; , ' \" ( ) $ € % @user https://x.io/a.png \xa0 é 😀".split(' ')
+PIECES = ["\n", "\n\n", "\n\n\n", "  ", " ", "\t", "    ", "<br>", "</br>", "<br/>", "<center>", "</center>", "<div class='x'>", "</div>", "<pre>", "</pre>", "<pre>\n  \n", 
+          "<textarea>", "</textarea>", "<b>", "</b>", "**bold**", "_it_", "`code`", "```\ncode\n```", "[link](https://a.b)", "![img](https://i.png)", "# Title", "## Sub", 
+          "> quote", "- item", "* item", "1. one", "---", "***", "===", "&amp;", "&nbsp;", "&foo;", "&#8217;", "&#150;", "&#x41;", "&#0;", "&#1;", "&#128;", "&lt", 
+          "<!-- c -->", "<!---->", "<!DOCTYPE html>", "<![CDATA[x]]>", "<?pi x?>", "<script>var a = '<b>';</script>", "<style>p{}</style>", "<img src='a.png'>", 
+          "<a href='x'>link</a>", "<p>", "</p>", "<table><tr><td>c</td></tr></table>", "<", ">", "&", "\\*", "<hr>", "<hr/>", "\r\n", "\x0c", "|a|b|\n|-|-|"]
+PLAIN_CHARS = "abc xyz hive é😀.,;:!?'\"()$%@-=+#1234567890\xa0"
+PLAIN_PIECES = ["word", " ", "\n", "\n\n", "\n\n\n", "  \n", " \n", "\n ", "1.", "-"]
+
+
+def markup_text(rnd : random.Random) -> str:
+    '''Random markdown / html (mostly taking the HTMLParser path)'''
+    return ''.join((rnd.choice(WORDS) if rnd.random() < 0.55 else rnd.choice(PIECES)) + rnd.choice([" ", "", "\n", " ", " "]) for _ in range(rnd.randint(0, 40)))
+
+def plain_text(rnd : random.Random) -> str:
+    '''Random plain text (mostly taking the fast path)'''
+    return ''.join(rnd.choice(PLAIN_CHARS) if rnd.random() < 0.3 else rnd.choice(PLAIN_PIECES) for _ in range(rnd.randint(0, 40)))
+
+def reference_html_to_text(html : str) -> list:
+    '''html_to_text before the fast path and TextExtractor'''
+    import markdown
+    from bs4 import BeautifulSoup
+    try:
+        html = markdown.markdown(html)
+    except:
+        pass
+
+    try:
+        return [str(text) for text in BeautifulSoup(html, features="html.parser").findAll(text=True)]
+    except:
+        return str(html)
+
+
+def load_fixture() -> list:
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def test_fixture_covers_both_paths():
+    paths = [bool(MARKUP_PATTERN.search(item["html"])) for item in load_fixture()]
+    assert paths.count(False) >= 50 and paths.count(True) >= 50
+
+@pytest.mark.parametrize("fast_path", [True, False], ids=["fast_path", "html_parser"])
+def test_fixture(fast_path : bool):
+    for item in load_fixture():
+        if fast_path == bool(MARKUP_PATTERN.search(item["html"])):
+            continue
+        assert helper.html_to_text(item["html"]) == item["expected"], item["html"]
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_markdown_and_bs4(seed : int):
+    pytest.importorskip("bs4")
+    warnings.filterwarnings("ignore")
+    rnd = random.Random(seed)
+    for i in range(500):
+        html = markup_text(rnd) if i % 2 else plain_text(rnd)
+        assert helper.html_to_text(html) == reference_html_to_text(html), html
@@ -0,0 +1,44 @@
+'''
+posts_manager.PostsCleaner.check against the in-memory backend (DATABASE_BACKEND = "memory", needs mongomock)
+'''
+import asyncio
+import pytest
+
+pytest.importorskip("mongomock")
+pytest.importorskip("beem")
+
+import database
+from database import MongoDBAsync, MemoryMongoClient
+from posts_manager import PostsCleaner
+
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_BACKEND", "memory")
+    monkeypatch.setattr(database, "DATABASE_NAME", "hive-discover")
+    monkeypatch.setattr(MemoryMongoClient, "store", None) # fresh store
+    MongoDBAsync.init_global(post_table=True)
+    return MongoDBAsync
+
+def insert_ids(collection, ids : list) -> None:
+    if len(ids) > 0:
+        asyncio.run(collection.insert_many([{"_id" : _id} for _id in ids]))
+
+def test_check_empty_collections(memory_db):
+    assert asyncio.run(PostsCleaner(chunk_size=3).check()) == ([], [], [])
+
+def test_check_without_post_info(memory_db):
+    # Nothing above the highest post_info _id is checked
+    insert_ids(memory_db.post_data, [1, 2])
+    insert_ids(memory_db.post_text, [3])
+    assert asyncio.run(PostsCleaner(chunk_size=3).check()) == ([], [], [])
+
+def test_check_finds_corrupted_and_orphans(memory_db):
+    insert_ids(memory_db.post_info, [1, 2, 3, 5, 8, 9, 10])
+    insert_ids(memory_db.post_data, [1, 2, 4, 5, 8, 9, 10, 11])
+    insert_ids(memory_db.post_text, [1, 3, 5, 6, 8, 9, 10])
+
+    corrupted, data_orphans, text_orphans = asyncio.run(PostsCleaner(chunk_size=3).check())
+    assert corrupted == [2, 3]
+    assert data_orphans == [4] # 11 is above the highest post_info _id (may be inserted right now)
+    assert text_orphans == [6]
@@ -0,0 +1,67 @@
+'''
+helper.pre_process_text (translate tables and compiled patterns) has to give the same text as the 
+former chain of replace / re.sub calls (legacy_pre_process_text). Lemmatizing is not part of the comparison.
+fixtures/pre_process_text.json holds inputs with the outputs of the former implementation.
+The inputs are synthetic, not recorded posts: benchmark corpus posts, handcrafted edge cases, fuzzed texts and 
+post bodies written in the style of Hive posts (markdown, html, image links, tables, unicode / emojis), 
+raw and after html_to_text.
+'''
+import json, os, random, re, string
+import pytest
+
+from helper import helper
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "pre_process_text.json")
+
+
+def legacy_pre_process_text(text : str) -> str:
+    '''pre_process_text before the translate tables (without lemmatizing)'''
+    text = re.sub(r'^https?:\/\/.*[\r\n]*', ' ', text, flags=re.MULTILINE)  # Remove simple Links
+    text = re.sub(r'[\(\[].*?[\)\]]', ' ', text, flags=re.MULTILINE) # Remove Markdown for Images and Links
+
+    # Replace other characters
+    text = text.replace('?', '.').replace('!', '.')
+    text = text.replace('\n', ' ')
+    text = text.replace('#', '').replace('-', ' ')
+    text = text.replace("'", ' ').replace(", ", ' ').replace(':', '.').replace(';', ' ')
+    text = text.replace('$ ', ' dollar ').replace(' $', ' dollar ')
+    text = text.replace('€ ', ' euro ').replace(' €', ' euro ')
+    text = text.replace('%', " percentage ")
+
+    # Remove whitespaces
+    while '  ' in text:
+        text = text.replace('  ', ' ')
+
+    # Remove multiple points
+    text = text.replace(' .', '.')
+    while '..' in text:
+        text = text.replace('..', '.')
+
+    text = text.lower()
+    text = re.sub(r'[^\x00-\x7F]+', ' ', text)
+    text = re.sub(r'@\w+', '', text)  
+    text = re.sub(r'[%s]' % re.escape(string.punctuation), ' ', text)
+    text = re.sub(r'[0-9]', '', text)
+    text = re.sub(r'\s{2,}', ' ', text)
+    return text
+
+def fuzz_texts(count : int, seed : int = 0) -> list:
+    '''Random texts of words and the characters pre_process_text handles specially'''
+    rnd = random.Random(seed)
+    pieces = ["hive", "Post", "CRYPTO", "price", "100", "3.5", "$", "$ ", " $", "€", "€ ", "%", "@user", "@x_1", "#tag", "-", "--", "'", ",", ", ",
+              ":", ";", "?", "!", ".", "..", " . ", "...", "(", ")", "[", "]", "![img](https://i.png)", "[link](https://a.b)", "https://x.io/a\n",
+              "http://y.io", "\n", "\n\n", "\r\n", "\t", "  ", " ", "é", "über", "😀", "\xa0", "_", "*", "&", "\"", "/", "\\", "~", "`", "{", "}", "|"]
+    return [''.join(rnd.choice(pieces) + rnd.choice(["", " ", " ", "\n"]) for _ in range(rnd.randint(0, 60))) for _ in range(count)]
+
+
+def test_golden_corpus():
+    with open(FIXTURE, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    assert len(golden) > 0
+    for item in golden:
+        assert helper.pre_process_text(item["text"], lemmatize=False) == item["expected"], item["text"]
+
+@pytest.mark.parametrize("seed", range(4))
+def test_matches_legacy_implementation(seed : int):
+    for text in fuzz_texts(2500, seed):
+        assert helper.pre_process_text(text, lemmatize=False) == legacy_pre_process_text(text), text
@@ -0,0 +1,48 @@
+'''
+WordVectorStore (export of the fasttext collections) has to return the same vectors and idf as WordVectorCache (MongoDB),
+bit for bit. Runs against the in-memory backend (needs mongomock)
+'''
+import asyncio
+import numpy as np
+import pytest
+
+pytest.importorskip("mongomock")
+
+from database import MemoryMongoClient
+from word_vectors import WordVectorCache, WordVectorStore
+
+
+@pytest.fixture
+def fasttext_dbs(monkeypatch):
+    '''(pymongo database, motor database) of a fresh in-memory store with some "en" tokens'''
+    monkeypatch.setattr(MemoryMongoClient, "store", None)
+    rnd = np.random.default_rng(0)
+    documents = [{"_id" : f"token{i}", "v" : rnd.standard_normal(300).astype(np.float32).tobytes(), "idf" : float(rnd.uniform(0.5, 12))} for i in range(50)]
+    documents[3].pop("idf") # no idf
+    documents[7]["idf"] = 1.0000000000000002 # not representable as float32
+
+    fasttext_db = MemoryMongoClient(is_async=False)["fasttext"]
+    fasttext_db["en"].insert_many(documents)
+    return (fasttext_db, MemoryMongoClient(is_async=True)["fasttext"])
+
+def test_store_matches_mongodb(fasttext_dbs, tmp_path):
+    fasttext_db, fasttext_db_async = fasttext_dbs
+    WordVectorStore.export(fasttext_db, str(tmp_path))
+    store = WordVectorStore(str(tmp_path))
+    assert store.has_lang("en")
+
+    tokens = [f"token{i}" for i in range(55)] # 50 to 54 are unknown
+    from_store = asyncio.run(store.lookup("en", tokens))
+    from_mongo = asyncio.run(WordVectorCache(fasttext_db_async).lookup("en", tokens))
+
+    assert from_store.keys() == from_mongo.keys() and len(from_store) == 50
+    for token, (vector, idf) in from_mongo.items():
+        assert from_store[token][0].tobytes() == vector.tobytes()
+        assert from_store[token][1] == idf and type(from_store[token][1]) == type(idf)
+
+def test_float32_idf_export_is_not_used(fasttext_dbs, tmp_path):
+    fasttext_db, _ = fasttext_dbs
+    WordVectorStore.export(fasttext_db, str(tmp_path))
+    np.save(tmp_path / "en.idf.npy", np.load(tmp_path / "en.idf.npy").astype(np.float32)) # like older exports
+
+    assert not WordVectorStore(str(tmp_path)).has_lang("en")
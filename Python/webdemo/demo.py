@@ -196,12 +196,33 @@ def get_plain_text(body : str) -> str:
     body = body.replace("&", " and ")
     return body
 
-def tokenize(title : str, body : str) -> list:
+@st.cache(allow_output_mutation=True)
+def get_nlp():
+    # Loaded once per process (lemmas need the tagger)
     import spacy
-    nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
+    return spacy.load('en_core_web_sm', disable=['parser', 'ner'])
+
+def tokenize(title : str, body : str) -> list:
+    nlp = get_nlp()
     return [token.lemma_ for token in nlp(title + " \n\n\n " + body)]
 
+@st.cache(allow_output_mutation=True)
+def get_word_vector_store():
+    # Local (memory-mapped) word-vectors, when they were exported
+    from word_vectors import WordVectorStore
+    if WORD_VECTOR_STORE_PATH and os.path.isdir(WORD_VECTOR_STORE_PATH):
+        store = WordVectorStore(WORD_VECTOR_STORE_PATH)
+        if store.has_lang("en"):
+            return store
+    return None
+
 def get_vectors(tokens : list) -> dict:
+    store = get_word_vector_store()
+    if store:
+        # One gather from the local store instead of the WordVec-API
+        known_tokens, vectors, _ = store.gather("en", tokens + ["(", "unknown", ")"])
+        return {token : vectors[row] for row, token in enumerate(known_tokens)}
+
     import json, requests
     payload = json.dumps(tokens + ["(", "unknown", ")"])
     response = requests.request("POST", 
@@ -0,0 +1,187 @@
+from config import *
+
+from collections import OrderedDict
+import numpy as np
+import json
+import os
+
+
+class WordVectorCache():
+    '''
+    Process-local LRU-Cache in front of the fasttext collections (one per language).
+    Stores for every token (vector : np.array[float32], idf : float) or None when the token is unknown.
+    '''
+    def __init__(self, fasttext_db, max_size : int = WORD_VECTOR_CACHE_SIZE) -> None:
+        self.fasttext_db = fasttext_db # motor database: mongo_client["fasttext"]
+        self.max_size = max_size # per language
+        self.caches = {} # {lang : OrderedDict(token : (vector, idf) | None)}
+        self.hits, self.misses = {}, {} # {lang : count}
+
+    def _get_cache(self, lang : str) -> OrderedDict:
+        if lang not in self.caches:
+            self.caches[lang] = OrderedDict()
+            self.hits[lang], self.misses[lang] = 0, 0
+        return self.caches[lang]
+
+    async def lookup(self, lang : str, tokens : list) -> dict:
+        '''Returns {token : (vector, idf)} for all known tokens. Only uncached tokens are fetched from MongoDB'''
+        cache = self._get_cache(lang)
+        entries, missing = {}, []
+        tokens = set(tokens)
+        for token in tokens:
+            if token in cache:
+                cache.move_to_end(token)
+                if cache[token] is not None:
+                    entries[token] = cache[token]
+            else:
+                missing.append(token)
+
+        self.hits[lang] += len(tokens) - len(missing)
+        self.misses[lang] += len(missing)
+
+        if len(missing) > 0:
+            fetched = {}
+            async for document in self.fasttext_db[lang].find({"_id" : {"$in" : missing}}):
+                # Decode Binary to np.array
+                fetched[document["_id"]] = (np.frombuffer(document["v"], dtype=np.float32), document.get("idf", None))
+
+            # Unknown tokens are cached as None, so they are not requested again
+            for token in missing:
+                cache[token] = fetched.get(token, None)
+            entries.update(fetched)
+
+            # Remove least recently used tokens
+            while len(cache) > self.max_size:
+                cache.popitem(last=False)
+
+        return entries
+
+    async def get_vectors(self, lang : str, tokens : list) -> dict:
+        '''Returns {token : vector} for all known tokens'''
+        return {token : vector for token, (vector, _) in (await self.lookup(lang, tokens)).items()}
+
+    def stats(self) -> dict:
+        '''Returns {lang : {"hits", "misses", "size"}}'''
+        return {lang : {"hits" : self.hits[lang], "misses" : self.misses[lang], "size" : len(self.caches[lang])} for lang in self.caches.keys()}
+
+
+class WordVectorStore():
+    '''
+    Local, memory-mapped export of the fasttext collections. For every language there are:
+        <lang>.vectors.npy : float32 matrix [tokens, 300]
+        <lang>.idf.npy : float64 array [tokens] (NaN when no idf exists; float64 like the idf from MongoDB)
+        <lang>.tokens.json : list of tokens (token -> row)
+    The matrices are opened with np.memmap, so several processes share them through the page cache.
+    Languages which are not exported are requested from the fallback (WordVectorCache) when given.
+    '''
+    def __init__(self, directory : str, fallback : WordVectorCache = None) -> None:
+        self.directory = directory
+        self.fallback = fallback
+        self.indexes, self.vectors, self.idf = {}, {}, {} # {lang : ...}
+
+        for filename in os.listdir(directory):
+            if filename.endswith(".tokens.json"):
+                self._open(filename[:-len(".tokens.json")])
+
+    def _open(self, lang : str) -> None:
+        with open(os.path.join(self.directory, f"{lang}.tokens.json"), "r") as f:
+            self.indexes[lang] = {token : row for row, token in enumerate(json.load(f))}
+
+        # Slicing keeps the memmap (rows behind the tokens are unused when the collection shrunk while exporting)
+        rows = len(self.indexes[lang])
+        idf = np.load(os.path.join(self.directory, f"{lang}.idf.npy"), mmap_mode="r")[:rows]
+        if idf.dtype != np.float64:
+            # Older export: rounded idf would change the tf-idf weights
+            print(f"[INFO] WordVectorStore: idf of '{lang}' is {idf.dtype}, not float64. Export it again, till then the fallback is used")
+            del self.indexes[lang]
+            return
+        self.vectors[lang] = np.load(os.path.join(self.directory, f"{lang}.vectors.npy"), mmap_mode="r")[:rows]
+        self.idf[lang] = idf
+
+    def has_lang(self, lang : str) -> bool:
+        return lang in self.indexes
+
+    def gather(self, lang : str, tokens : list) -> tuple:
+        '''
+        Fetches all known tokens with one fancy-index gather. 
+        Returns (known_tokens : list, vectors : np.array [known, 300], idf : np.array [known])
+        '''
+        index = self.indexes[lang]
+        known_tokens = [token for token in tokens if token in index]
+        rows = np.fromiter((index[token] for token in known_tokens), dtype=np.int64, count=len(known_tokens))
+        return (known_tokens, self.vectors[lang][rows], self.idf[lang][rows])
+
+    async def lookup(self, lang : str, tokens : list) -> dict:
+        '''Returns {token : (vector, idf)} for all known tokens (same as WordVectorCache.lookup)'''
+        if not self.has_lang(lang):
+            return await self.fallback.lookup(lang, tokens) if self.fallback else {}
+
+        known_tokens, vectors, idf = self.gather(lang, list(set(tokens)))
+        return {token : (vectors[row], None if np.isnan(idf[row]) else float(idf[row])) for row, token in enumerate(known_tokens)}
+
+    async def get_vectors(self, lang : str, tokens : list) -> dict:
+        '''Returns {token : vector} for all known tokens'''
+        if not self.has_lang(lang):
+            return await self.fallback.get_vectors(lang, tokens) if self.fallback else {}
+
+        known_tokens, vectors, _ = self.gather(lang, list(set(tokens)))
+        return {token : vectors[row] for row, token in enumerate(known_tokens)}
+
+    def stats(self) -> dict:
+        return self.fallback.stats() if self.fallback else {}
+
+    @staticmethod
+    def export(fasttext_db, directory : str, langs : list = None) -> None:
+        '''Exports the fasttext collections (pymongo database) into directory. All languages, when langs is None'''
+        os.makedirs(directory, exist_ok=True)
+        if not langs:
+            langs = fasttext_db.list_collection_names()
+
+        for lang in langs:
+            count = fasttext_db[lang].count_documents({})
+            if count == 0:
+                continue
+            dim = len(np.frombuffer(fasttext_db[lang].find_one({})["v"], dtype=np.float32))
+            path = lambda name: os.path.join(directory, f"{lang}.{name}")
+
+            # Write to temporary files first: running workers keep their (old) mapping until they restart
+            vectors = np.lib.format.open_memmap(path("vectors.tmp.npy"), mode="w+", dtype=np.float32, shape=(count, dim))
+            idf = np.full(count, np.nan, dtype=np.float64)
+            tokens = []
+            for row, document in enumerate(fasttext_db[lang].find({}).limit(count)):
+                vectors[row] = np.frombuffer(document["v"], dtype=np.float32)
+                if document.get("idf", None) is not None:
+                    idf[row] = document["idf"]
+                tokens.append(document["_id"])
+            vectors.flush()
+            del vectors
+
+            np.save(path("idf.tmp.npy"), idf)
+            with open(path("tokens.tmp.json"), "w") as f:
+                json.dump(tokens, f)
+
+            for name in ("vectors", "idf"):
+                os.replace(path(f"{name}.tmp.npy"), path(f"{name}.npy"))
+            os.replace(path("tokens.tmp.json"), path("tokens.json"))
+            print(f"[INFO] Exported {len(tokens)} tokens for '{lang}'")
+
+
+def get_word_vector_source(fasttext_db):
+    '''Returns a WordVectorStore (when WORD_VECTOR_STORE_PATH is set) with a WordVectorCache as fallback, else only the WordVectorCache'''
+    cache = WordVectorCache(fasttext_db)
+    if WORD_VECTOR_STORE_PATH and os.path.isdir(WORD_VECTOR_STORE_PATH):
+        return WordVectorStore(WORD_VECTOR_STORE_PATH, fallback=cache)
+    return cache
+
+
+if __name__ == '__main__':
+    import argparse
+    from database import MongoDB
+
+    parser = argparse.ArgumentParser(description="Export the fasttext collections into a memory-mapped WordVectorStore")
+    parser.add_argument("directory", help="target directory", nargs="?", default=WORD_VECTOR_STORE_PATH)
+    parser.add_argument("-l", "--langs", help="languages to export (default: all)", nargs="*")
+    args = parser.parse_args()
+
+    MongoDB.init_global()
+    WordVectorStore.export(MongoDB.mongo_client["fasttext"], args.directory, args.langs)